@@ -0,0 +1,54 @@
+"""
+Compare the throughput, in messages per second, of
+:class:`honcho.channel.Channel` with that of the :class:`multiprocessing.Queue`
+it replaced, when sending output from a child process to its parent.
+
+Usage::
+
+    python benchmarks/bench_channel.py
+"""
+import multiprocessing
+import time
+
+from honcho import clock
+from honcho.channel import Channel
+from honcho.printer import Message
+
+MESSAGES = 100000
+
+
+def _send(events, data, count):
+    for _ in range(count):
+        events.put(Message(type='line',
+                           data=data,
+                           time=clock.now(),
+                           name='worker.1',
+                           colour='31'))
+
+
+def _run(events, data, count):
+    child = multiprocessing.Process(target=_send, args=(events, data, count))
+    start = time.perf_counter()
+    child.start()
+    for _ in range(count):
+        events.get()
+    elapsed = time.perf_counter() - start
+    child.join()
+    return count / elapsed
+
+
+def main():
+    for lines in (1, 100):
+        data = (b'x' * 60 + b'\n') * lines
+        count = MESSAGES // lines
+        channel = Channel()
+        channel.register('worker.1', '31')
+        for name, events in (('Queue', multiprocessing.Queue()),
+                             ('Channel', channel)):
+            rate = _run(events, data, count)
+            print('%-8s %3d lines per message: %9.0f messages/s'
+                  % (name, lines, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Measure how much memory the environments of many processes take up in the
+manager, with each process's environment either a full copy of the OS and
+application environments (as Honcho used to make) or a
+:class:`~honcho.environ.LayeredEnv` sharing them.
+
+Usage::
+
+    python benchmarks/bench_env_memory.py [INSTANCES] [VARIABLES]
+"""
+import sys
+import tracemalloc
+
+from honcho import environ
+
+PROCESSES = {'web': 'python -m http.server', 'worker': 'python worker.py'}
+
+
+def _copied(os_env, app_env, concurrency):
+    envs = []
+    for p in environ.expand_processes(PROCESSES, concurrency=concurrency,
+                                      env=app_env, port=5000):
+        e = os_env.copy()
+        e.update(p.env)
+        envs.append(e)
+    return envs
+
+
+def _layered(os_env, app_env, concurrency):
+    return [environ.LayeredEnv(p.env, os_env)
+            for p in environ.expand_processes(PROCESSES, concurrency=concurrency,
+                                              env=app_env, port=5000)]
+
+
+def _measure(build, *args):
+    tracemalloc.start()
+    envs = build(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del envs
+    return size
+
+
+def main():
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    variables = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    # Half the variables come from the OS environment, and half from the
+    # application's .env files.
+    os_env = {'OS_VAR_%d' % i: 'x' * 32 for i in range(variables // 2)}
+    app_env = {'APP_VAR_%d' % i: 'y' * 32 for i in range(variables // 2)}
+    concurrency = {'web': instances // 2, 'worker': instances - instances // 2}
+
+    for label, build in (('copied', _copied), ('layered', _layered)):
+        size = _measure(build, os_env, app_env, concurrency)
+        print('%-8s %d instances, %d variables: %10.1fKiB'
+              % (label, instances, variables, size / 1024))
+
+
+if __name__ == '__main__':
+    main()
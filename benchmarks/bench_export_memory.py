@@ -0,0 +1,75 @@
+"""
+Measure the peak memory used in exporting many instances of a process type
+(as with ``honcho export -c worker=5000``), with the processes expanded lazily
+by :func:`honcho.environ.expand_processes`, or all at once up front (as
+Honcho used to do).
+
+Usage::
+
+    python benchmarks/bench_export_memory.py [INSTANCES]
+"""
+import sys
+import tracemalloc
+
+from honcho import environ
+from honcho.export.runit import Export as RunitExport
+from honcho.export.supervisord import Export as SupervisordExport
+from honcho.export.systemd import Export as SystemdExport
+from honcho.export.upstart import Export as UpstartExport
+
+FORMATS = (
+    ('runit', RunitExport),
+    ('supervisord', SupervisordExport),
+    ('systemd', SystemdExport),
+    ('upstart', UpstartExport),
+)
+
+CONTEXT = {
+    'app': 'app',
+    'app_root': '/srv/app',
+    'log': '/var/log/app',
+    'shell': '/bin/sh',
+    'user': 'app',
+}
+
+
+def _export(export_ctor, processes):
+    # Render every file, but keep only the size of each, as though it had
+    # been written out.
+    export = export_ctor()
+    return sum(len(f.content) for f in export.render(processes, dict(CONTEXT)))
+
+
+def _peak(export_ctor, expand):
+    tracemalloc.start()
+    _export(export_ctor, expand())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    instances = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    app_env = {'APP_VAR_%d' % i: 'y' * 32 for i in range(50)}
+
+    def lazy():
+        return environ.expand_processes({'web': 'python -m http.server',
+                                         'worker': 'python worker.py'},
+                                        concurrency={'worker': instances},
+                                        env=app_env,
+                                        port=5000)
+
+    def eager():
+        return list(lazy())
+
+    for name, export_ctor in FORMATS:
+        # Load the templates before measuring.
+        _export(export_ctor, lazy()[:1])
+        print('%-12s worker=%d: eager %8.1fKiB, lazy %8.1fKiB'
+              % (name, instances,
+                 _peak(export_ctor, eager) / 1024,
+                 _peak(export_ctor, lazy) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measure the throughput of :class:`honcho.printer.Printer`, in lines per
+second, when writing to an in-memory buffer.
+
+Usage::
+
+    python benchmarks/bench_printer.py
+"""
+import datetime
+import io
+import time
+
+from honcho.printer import Message, Printer
+
+LINES = 200000
+
+
+class TTYBuffer(io.StringIO):
+
+    def isatty(self):
+        return True
+
+
+def _binary():
+    return io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+
+
+def _messages(lines_per_message, processes=4):
+    line = b'x' * 60 + b'\n'
+    start = datetime.datetime(2012, 8, 11, 12, 42)
+    for i in range(LINES // lines_per_message):
+        # Advance the clock by a millisecond per message, so that the
+        # timestamp changes once a second as it would in real use.
+        yield Message(type='line',
+                      data=line * lines_per_message,
+                      time=start + datetime.timedelta(milliseconds=i),
+                      name='worker.%d' % (i % processes),
+                      colour=str(31 + i % processes))
+
+
+def bench(label, printer, lines_per_message):
+    messages = list(_messages(lines_per_message))
+    start = time.perf_counter()
+    for msg in messages:
+        printer.write(msg)
+    elapsed = time.perf_counter() - start
+    print('%-40s %12.0f lines/s' % (label, LINES / elapsed))
+
+
+def main():
+    bench('one line per message',
+          Printer(io.StringIO(), width=8), 1)
+    bench('one line per message, colour',
+          Printer(TTYBuffer(), width=8), 1)
+    bench('100 lines per message',
+          Printer(io.StringIO(), width=8), 100)
+    bench('100 lines per message, colour',
+          Printer(TTYBuffer(), width=8), 100)
+    bench('one line per message, binary',
+          Printer(_binary(), width=8), 1)
+    bench('100 lines per message, binary',
+          Printer(_binary(), width=8), 100)
+    bench('one line per message, no prefix',
+          Printer(io.StringIO(), prefix=False), 1)
+    bench('one line per message, no prefix, binary',
+          Printer(_binary(), prefix=False), 1)
+    bench('100 lines per message, no prefix, binary',
+          Printer(_binary(), prefix=False), 100)
+
+
+if __name__ == '__main__':
+    main()
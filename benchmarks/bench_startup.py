@@ -0,0 +1,41 @@
+"""
+Measure how long it takes each of the managers in :mod:`honcho.manager` to
+start large numbers of processes, as reported by
+:attr:`~honcho.manager.Manager.startup_time`.
+
+Usage::
+
+    python benchmarks/bench_startup.py [PROCESSES]
+"""
+import io
+import sys
+import time
+
+from honcho.manager import Manager, SelectorManager
+from honcho.printer import Printer
+
+PROCESSES = 200
+
+
+def _run(manager_cls, processes):
+    manager = manager_cls(Printer(io.StringIO()))
+    for i in range(processes):
+        # Each process must run long enough for all of them to start before
+        # the first exits and the rest are terminated.
+        manager.add_process('worker.%d' % (i + 1), 'sleep 5')
+    start = time.perf_counter()
+    manager.loop()
+    total = time.perf_counter() - start
+    return manager.startup_time, total
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else PROCESSES
+    for manager_cls in (Manager, SelectorManager):
+        startup, total = _run(manager_cls, processes)
+        print('%-16s %5d processes: all started in %.3fs (%.3fs total)'
+              % (manager_cls.__name__, processes, startup, total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measure how long the honcho command line takes to start up, for commands
+which don't need to manage processes, using ``python -X importtime`` to
+report the time spent importing :mod:`honcho.command` and everything it
+imports.
+
+Usage::
+
+    python benchmarks/bench_startup_cli.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 20
+
+COMMANDS = (
+    ['version'],
+    ['check'],
+    ['run', 'true'],
+)
+
+
+def _import_time(argv, cwd):
+    # Each line of -X importtime output ends with the cumulative time (in
+    # microseconds) and the module name.
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'honcho', *argv],
+                            cwd=cwd, capture_output=True, text=True)
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and line.endswith(' honcho.command'):
+            return int(line.split('|')[1])
+
+
+def _wall_time(argv, cwd):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'honcho', *argv], cwd=cwd,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cwd:
+        with open(os.path.join(cwd, 'Procfile'), 'w') as f:
+            f.write('web: python -m http.server\n')
+        for argv in COMMANDS:
+            print('honcho %-10s import honcho.command: %6.1fms, total: %6.1fms'
+                  % (' '.join(argv),
+                     min(_import_time(argv, cwd) for _ in range(5)) / 1000,
+                     _wall_time(argv, cwd) * 1000))
+
+
+if __name__ == '__main__':
+    main()
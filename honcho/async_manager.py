@@ -0,0 +1,332 @@
+import asyncio
+import subprocess
+import sys
+
+from . import clock
+from .colour import get_colours
+from .compat import ON_WINDOWS, ProcessManager
+from .manager import KILL_WAIT, SYSTEM_PRINTER_NAME, _ProcessState
+from .printer import Message, Printer
+from .process import DRAIN_WAIT, SPAWN_FAILED, LineBuffer, Process, split_command
+
+
+class AsyncManager(object):
+    """
+    AsyncManager is an asyncio-native counterpart to
+    :class:`~honcho.manager.Manager`, for embedding Honcho in applications
+    which already run an asyncio event loop. Processes are run with
+    :func:`asyncio.create_subprocess_shell`, so no threads or additional Python
+    processes are needed, and any number of AsyncManager instances may share
+    a single event loop.
+
+    Unlike :class:`~honcho.manager.Manager`, AsyncManager does not install any
+    signal handlers: it is up to the embedding application to call
+    :func:`~honcho.async_manager.AsyncManager.terminate` when appropriate.
+
+    Example::
+
+        import asyncio
+        from honcho.async_manager import AsyncManager
+
+        async def main():
+            m = AsyncManager()
+            m.add_process('server', 'ruby server.rb')
+            m.add_process('worker', 'python worker.py')
+            await m.loop()
+            return m.returncode
+
+        asyncio.run(main())
+    """
+
+    #: After :func:`~honcho.async_manager.AsyncManager.loop` finishes (or
+    #: :func:`~honcho.async_manager.AsyncManager.events` is exhausted), this
+    #: will contain a return code that can be used with `sys.exit`.
+    returncode = None
+
+    def __init__(self, printer=None):
+        self.returncode = None
+
+        self._colours = get_colours()
+        self._clock = clock.Clock
+        self._procmgr = ProcessManager()
+
+        self._printer = printer if printer is not None else Printer(sys.stdout)
+        self._printer.width = len(SYSTEM_PRINTER_NAME)
+
+        self._processes = {}
+        self._stopped = 0
+        self._queue = None
+        self._tasks = []
+        self._kill_timer = None
+
+        self._terminating = False
+
+    def add_process(self, name, cmd, quiet=False, env=None, cwd=None,
+                    max_line_length=None, truncate_lines=False, quiet_log=None,
+                    direct_exec=False):
+        """
+        Add a process to this manager instance. The process will not be started
+        until :func:`~honcho.async_manager.AsyncManager.loop` is awaited or
+        :func:`~honcho.async_manager.AsyncManager.events` is iterated.
+        """
+        assert name not in self._processes, "process names must be unique"
+        proc = Process(cmd,
+                       name=name,
+                       quiet=quiet,
+                       colour=next(self._colours),
+                       env=env,
+                       cwd=cwd,
+                       max_line_length=max_line_length,
+                       truncate_lines=truncate_lines,
+                       quiet_log=quiet_log,
+                       direct_exec=direct_exec)
+        self._processes[name] = _ProcessState(proc)
+
+        # Update printer width to accommodate this process name
+        self._printer.width = max(self._printer.width, len(name))
+
+        return proc
+
+    async def loop(self):
+        """
+        Start all the added processes and multiplex their output onto the bound
+        printer (which by default will print to STDOUT).
+
+        If one process terminates, all the others will be terminated by
+        Honcho, and :func:`~honcho.async_manager.AsyncManager.loop` will
+        return once they have all exited.
+        """
+        async for msg in self.events():
+            if msg.type == 'line':
+                self._printer.write(msg)
+                if self._queue.empty():
+                    self._flush_printer()
+            elif msg.type == 'start':
+                self._system_print("%s started (pid=%s)\n"
+                                   % (msg.name, msg.data['pid']))
+            elif msg.type == 'stop':
+                self._system_print("%s stopped (rc=%s)\n"
+                                   % (msg.name, msg.data['returncode']))
+
+    async def events(self):
+        """
+        Start all the added processes and asynchronously iterate over the
+        :class:`~honcho.printer.Message` objects describing their lifecycle
+        ('start' and 'stop' events) and output ('line' events).
+
+        As with :func:`~honcho.async_manager.AsyncManager.loop`, if one process
+        terminates, all the others will be terminated, and iteration will end
+        once they have all exited.
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._run(p.obj))
+                       for p in self._processes.values()]
+
+        try:
+            while not self._all_stopped():
+                msg = await self._queue.get()
+                p = self._processes[msg.name]
+                if msg.type == 'start':
+                    p.pid = msg.data['pid']
+                elif msg.type == 'stop':
+                    if p.returncode is None:
+                        self._stopped += 1
+                    p.returncode = msg.data['returncode']
+                    if self.returncode is None:
+                        self.returncode = msg.data['returncode']
+                    if not self._terminating:
+                        self._signal_all()
+                        self._kill_timer = asyncio.get_running_loop().call_later(
+                            KILL_WAIT, self._signal_all, True)
+                yield msg
+        finally:
+            if self._kill_timer is not None:
+                self._kill_timer.cancel()
+
+    async def terminate(self):
+        """
+        Terminate all processes managed by this AsyncManager, and wait for them
+        to exit. Any processes still running after KILL_WAIT seconds will be
+        killed.
+        """
+        self._signal_all()
+        # Don't use asyncio.wait_for, which would cancel the tasks running the
+        # processes (and so stop them reporting their exit) on timing out.
+        if not await self._wait(KILL_WAIT):
+            await self.kill()
+
+    async def kill(self):
+        """
+        Kill all processes managed by this AsyncManager, and wait for them to
+        exit.
+        """
+        self._signal_all(force=True)
+        await self._wait()
+
+    async def _run(self, proc):
+        output = proc._open_output() if proc.quiet else subprocess.PIPE
+        options = {
+            'stdin': None,
+            'stdout': output,
+            'stderr': subprocess.STDOUT,
+            'env': dict(proc.env),
+            'cwd': proc.cwd,
+        }
+        if ON_WINDOWS:
+            options.update(creationflags=0x08000000)  # CREATE_NO_WINDOW
+        else:
+            options.update(start_new_session=True)
+
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        argv = None
+        if proc.direct_exec and not ON_WINDOWS:
+            argv = split_command(proc.cmd)
+        try:
+            if argv is not None:
+                try:
+                    await loop.subprocess_exec(
+                        lambda: _ProcessProtocol(self, proc, done), *argv, **options)
+                except OSError:
+                    # As in honcho.process.Popen, leave the shell to report a
+                    # command which can't be run.
+                    argv = None
+            if argv is None:
+                await loop.subprocess_shell(
+                    lambda: _ProcessProtocol(self, proc, done), proc.cmd, **options)
+        except OSError as e:
+            # Report the process as having stopped, as a shell would if it
+            # couldn't run the command, so that the others are terminated.
+            self._system_print("%s failed to start: %s\n" % (proc.name, e))
+            self._put(proc, {'returncode': SPAWN_FAILED}, type='stop')
+            return
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+        await done
+
+    async def _wait(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (or forever, if None) for all processes to
+        exit, without cancelling anything, and return whether they all have.
+        """
+        if not self._tasks:
+            return True
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        return not pending
+
+    def _signal_all(self, force=False):
+        """Signal all remaining processes, forcefully if requested."""
+        if not force:
+            if self._terminating:
+                return
+            self._terminating = True
+
+        for n, p in self._processes.items():
+            self._signal(n, p, force)
+
+    def _signal(self, name, p, force=False):
+        if p.process is None or p.process.get_returncode() is not None:
+            return
+        pid = p.process.get_pid()
+        signame = 'SIGKILL' if force else 'SIGTERM'
+        self._system_print("sending %s to %s (pid %s)\n" %
+                           (signame, name, pid))
+        if force:
+            self._procmgr.kill(pid)
+        else:
+            self._procmgr.terminate(pid)
+
+    def _all_stopped(self):
+        return self._stopped == len(self._processes)
+
+    def _put(self, proc, data, type='line'):
+        self._queue.put_nowait(Message(type=type,
+                                       data=data,
+                                       time=self._clock.now(),
+                                       name=proc.name,
+                                       colour=proc.colour))
+
+    def _system_print(self, data):
+        self._printer.write(Message(type='line',
+                                    data=data,
+                                    time=self._clock.now(),
+                                    name=SYSTEM_PRINTER_NAME,
+                                    colour=None))
+        self._flush_printer()
+
+    def _flush_printer(self):
+        # Printers need not support buffering.
+        flush = getattr(self._printer, 'flush', None)
+        if flush is not None:
+            flush()
+
+
+class _ProcessProtocol(asyncio.SubprocessProtocol):
+    """
+    Forwards the output of a process to its AsyncManager, and resolves the
+    given future once the process has exited and its output is exhausted.
+
+    A process is considered to have stopped as soon as it exits, regardless of
+    whether its output pipe has been closed: the pipe may be held open by a
+    longer-lived grandchild. Any further output is read for at most DRAIN_WAIT
+    seconds.
+    """
+
+    def __init__(self, manager, proc, done):
+        self._manager = manager
+        self._proc = proc
+        self._done = done
+        self._transport = None
+        self._lines = LineBuffer(proc.max_line_length, proc.truncate_lines)
+        self._exited = False
+        self._finished = False
+        # A quiet process's output isn't piped to us at all.
+        self._eof = proc.quiet
+        self._drain_timer = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+        p = self._manager._processes[self._proc.name]
+        p.process = transport
+        self._manager._put(self._proc, {'pid': transport.get_pid()}, type='start')
+        if self._manager._terminating:
+            # Another process stopped before this one had started.
+            self._manager._signal(self._proc.name, p)
+
+    def pipe_data_received(self, fd, data):
+        data = self._lines.feed(data)
+        if data and not self._proc.quiet:
+            self._manager._put(self._proc, data)
+
+    def pipe_connection_lost(self, fd, exc):
+        if fd != 1:
+            return
+        self._eof = True
+        if self._exited:
+            self._finish()
+
+    def process_exited(self):
+        self._exited = True
+        if self._eof:
+            self._finish()
+        else:
+            loop = asyncio.get_running_loop()
+            self._drain_timer = loop.call_later(DRAIN_WAIT, self._finish)
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self._drain_timer is not None:
+            self._drain_timer.cancel()
+        data = self._lines.flush()
+        if data and not self._proc.quiet:
+            self._manager._put(self._proc, data)
+        returncode = self._transport.get_returncode()
+        self._transport.close()
+        self._manager._put(self._proc, {'returncode': returncode}, type='stop')
+        # Whoever was waiting for this may have been cancelled, but the 'stop'
+        # event must be sent regardless.
+        if not self._done.done():
+            self._done.set_result(None)
@@ -0,0 +1,105 @@
+import collections
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import struct
+
+from .printer import Message
+
+# Each frame sent over a Channel consists of this header, followed by the
+# output (for 'line' events). The header contains the index of the process
+# the event is from, the type of the event, its time (from honcho.clock), and
+# its pid or returncode (for 'start' and 'stop' events).
+HEADER = struct.Struct('!IBqq')
+
+TYPES = ('line', 'start', 'stop')
+
+
+class Channel(object):
+    """
+    Channel carries events from processes run by a
+    :class:`~honcho.manager.Manager` back to the manager. It has the same
+    `put` and `get` methods as :class:`multiprocessing.Queue`, but rather than
+    being pickled, each event is sent as a single compact binary frame over a
+    pipe, and a :class:`~honcho.printer.Message` is only made from it again
+    once it has been received.
+
+    Only processes added with :func:`~honcho.channel.Channel.register` before
+    the processes sending events for them are started can send events.
+    Events put by the process which created the Channel (such as signals
+    received by the manager) are passed along in memory, without touching the
+    pipe, and so may be of any type.
+    """
+
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._lock = multiprocessing.Lock()
+        self._processes = []
+        self._indices = {}
+
+        self._owner = os.getpid()
+        self._local = collections.deque()
+        self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+
+    def register(self, name, colour=None):
+        """Allow events to be sent for the named process."""
+        self._indices[name] = len(self._processes)
+        self._processes.append((name, colour))
+
+    def put(self, msg):
+        if os.getpid() == self._owner:
+            was_empty = not self._local
+            self._local.append(msg)
+            if was_empty:
+                # Wake up anyone waiting in get().
+                self._wakeup_writer.send_bytes(b'')
+            return
+
+        frame = self._encode(msg)
+        with self._lock:
+            self._writer.send_bytes(frame)
+
+    def get(self, timeout=None):
+        """
+        Return the next event, waiting up to `timeout` seconds (or forever, if
+        None) for one to arrive. Raises :class:`queue.Empty` if none does.
+        """
+        while True:
+            if self._local:
+                return self._local.popleft()
+            if self._reader.poll():
+                return self._decode(self._reader.recv_bytes())
+
+            ready = multiprocessing.connection.wait(
+                [self._reader, self._wakeup_reader], timeout)
+            if not ready:
+                raise queue.Empty
+            while self._wakeup_reader.poll():
+                self._wakeup_reader.recv_bytes()
+            timeout = 0
+
+    def _encode(self, msg):
+        index = self._indices[msg.name]
+        timestamp = msg.time
+        if msg.type == 'line':
+            return HEADER.pack(index, 0, timestamp, 0) + msg.data
+        if msg.type == 'start':
+            return HEADER.pack(index, 1, timestamp, msg.data['pid'])
+        return HEADER.pack(index, 2, timestamp, msg.data['returncode'])
+
+    def _decode(self, frame):
+        index, code, timestamp, value = HEADER.unpack_from(frame)
+        name, colour = self._processes[index]
+        type = TYPES[code]
+        if type == 'line':
+            data = frame[HEADER.size:]
+        elif type == 'start':
+            data = {'pid': value}
+        else:
+            data = {'returncode': value}
+        return Message(type=type,
+                       data=data,
+                       time=timestamp,
+                       name=name,
+                       colour=colour)
@@ -0,0 +1,54 @@
+"""
+Honcho timestamps events using the monotonic clock, which is cheap to read and
+never jumps backwards (as the wall clock may, when it is adjusted), and only
+converts timestamps to wall-clock time when they are printed. The conversion
+is relative to a single wall-clock time captured when this module is imported.
+"""
+import datetime
+import time
+
+NS_PER_SECOND = 1000000000
+
+#: The monotonic time, in nanoseconds, at which Honcho started.
+START = time.monotonic_ns()
+
+#: The wall-clock time, in nanoseconds since the epoch, at which Honcho
+#: started.
+BASE = time.time_ns()
+
+#: The difference between wall-clock and monotonic time, in nanoseconds.
+OFFSET = BASE - START
+
+
+def now():
+    """Return the current time, in nanoseconds on the monotonic clock."""
+    return time.monotonic_ns()
+
+
+class Clock(object):
+    """
+    Clock provides :func:`now` as a method of a (picklable) object, so that it
+    can be replaced with a fake clock in tests.
+    """
+
+    now = staticmethod(now)
+
+
+def to_datetime(timestamp):
+    """Convert a timestamp returned by :func:`now` to a local datetime."""
+    seconds, ns = divmod(timestamp + OFFSET, NS_PER_SECOND)
+    return datetime.datetime.fromtimestamp(seconds).replace(microsecond=ns // 1000)
+
+
+def from_datetime(dt):
+    """Convert a local datetime to a timestamp as returned by :func:`now`."""
+    return int(dt.timestamp() * NS_PER_SECOND) - OFFSET
+
+
+def elapsed(timestamp):
+    """
+    Format a timestamp returned by :func:`now` as the time elapsed since
+    Honcho started, to the millisecond, as in '+12.345s'.
+    """
+    ms = max(0, timestamp - START) // 1000000
+    return '+%d.%03ds' % divmod(ms, 1000)
@@ -1,22 +1,17 @@
 import argparse
 import codecs
 import logging
+import math
 import os
 import shlex
 import signal
 import sys
 from collections import ChainMap, OrderedDict, defaultdict
+from collections.abc import Mapping
 
 from honcho import __version__, compat, environ
 from honcho.environ import Env
-from honcho.manager import Manager
-from honcho.printer import Printer
-from honcho.process import Popen
-
-if sys.version_info < (3, 10):
-    from backports.entry_points_selectable import entry_points
-else:
-    from importlib.metadata import entry_points
+from honcho.ports import DEFAULT_STRIDE, STRATEGIES, PortAllocator, describe
 
 logging.basicConfig(format='%(asctime)s [%(process)d] [%(levelname)s] '
                            '%(message)s',
@@ -33,16 +28,62 @@ ENV_ARGS = {
     'port': 'PORT',
     'procfile': 'PROCFILE',
 }
+ENGINES = ('fork', 'select')
+# As honcho.manager.OVERFLOW_POLICIES, which we don't import until needed.
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+# Included in the keys of HONCHO_ENV_CACHE entries, so that entries made by
+# other versions of honcho aren't used. Change it whenever the way environment
+# files are parsed (or the format of cache entries) changes.
+ENV_CACHE_VERSION = 1
+
+
+class _ExportChoices(Mapping):
+    """
+    The installed exporters, by name. Finding them means scanning the metadata
+    of every installed distribution, so this isn't done until they are needed.
+    """
+
+    def __init__(self):
+        self._exporters = None
+
+    def _load(self):
+        if self._exporters is None:
+            if sys.version_info < (3, 10):
+                from backports.entry_points_selectable import entry_points
+            else:
+                from importlib.metadata import entry_points
+            self._exporters = dict(
+                (e.name, e) for e in entry_points(group="honcho_exporters")
+            )
+        return self._exporters
+
+    def __getitem__(self, name):
+        return self._load()[name]
+
+    def __iter__(self):
+        return iter(sorted(self._load()))
 
-export_choices = dict(
-    (_export.name, _export) for _export in entry_points(group="honcho_exporters")
-)
+    def __len__(self):
+        return len(self._load())
+
+
+export_choices = _ExportChoices()
 
 
 class CommandError(Exception):
     pass
 
 
+def _positive_int(value):
+    try:
+        result = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if result < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: '{value}'")
+    return result
+
+
 def _add_common_args(parser, with_defaults=False):
     suppress = None if with_defaults else argparse.SUPPRESS
     parser.add_argument('-e', '--env',
@@ -69,6 +110,23 @@ def _add_common_args(parser, with_defaults=False):
                         version='%(prog)s ' + __version__)
 
 
+def _add_port_args(parser):
+    parser.add_argument('--port-strategy',
+                        choices=STRATEGIES, default='stride',
+                        help='give the instances of each process type ports '
+                             'from the next multiple of the port stride '
+                             '(stride), or straight after those of the type '
+                             'before (pack) (default: stride)')
+    parser.add_argument('--port-stride',
+                        type=int, default=DEFAULT_STRIDE, metavar='N',
+                        help='the gap between the first ports of each process '
+                             f'type (default: {DEFAULT_STRIDE})')
+    parser.add_argument('--probe-ports',
+                        action='store_true',
+                        help='skip over ports which are already in use on '
+                             'this host')
+
+
 parser = argparse.ArgumentParser(
     'honcho',
     description='Manage Procfile-based applications')
@@ -104,10 +162,11 @@ def command_export(args):
     concurrency = _parse_concurrency(args.concurrency)
     port = _port(env)
 
-    processes = environ.expand_processes(procfile.processes,
-                                         concurrency=concurrency,
-                                         env=app_env,
-                                         port=port)
+    processes = _expand_processes(args,
+                                  procfile.processes,
+                                  concurrency=concurrency,
+                                  env=app_env,
+                                  port=port)
 
     export_ctor = export_choices[args.format].load()
     export = export_ctor(template_dir=args.template_dir)
@@ -149,6 +208,7 @@ parser_export.add_argument(
     '-c', '--concurrency',
     help='number of each process type to run.',
     type=str, metavar='process=num,process=num')
+_add_port_args(parser_export)
 parser_export.add_argument(
     '-u', '--user',
     help="user the application should run as",
@@ -164,7 +224,7 @@ parser_export.add_argument(
 parser_export.add_argument(
     'format',
     help="format to export to; one of %(choices)s",
-    choices=sorted(export_choices.keys()),
+    choices=export_choices,
     type=str, metavar="FORMAT")
 parser_export.add_argument(
     'location',
@@ -186,6 +246,8 @@ parser_help.add_argument('task', help='task to show help for', nargs='?')
 
 
 def command_run(args):
+    from honcho.process import Popen
+
     os.environ.update(_read_env(args.app_root, args.env))
 
     argv = args.argv
@@ -219,6 +281,9 @@ parser_run.add_argument(
 
 
 def command_start(args):
+    from honcho.manager import Manager, SelectorManager
+    from honcho.printer import Printer
+
     config = map_from(args)
     env = Env(config)
 
@@ -226,6 +291,7 @@ def command_start(args):
     concurrency = _parse_concurrency(args.concurrency)
     app_env = _read_env(args.app_root, args.env)
     quiet = _parse_quiet(args.quiet)
+    rate_limits = _parse_rate_limit(args.rate_limit)
     port = _port(env)
 
     if args.processes:
@@ -238,18 +304,36 @@ def command_start(args):
     else:
         processes = procfile.processes
 
-    manager = Manager(Printer(sys.stdout,
-                              colour=(not args.no_colour),
-                              prefix=(not args.no_prefix)))
-
-    for p in environ.expand_processes(processes,
-                                      concurrency=concurrency,
-                                      env=app_env,
-                                      quiet=quiet,
-                                      port=port):
-        e = os.environ.copy()
-        e.update(p.env)
-        manager.add_process(p.name, p.cmd, quiet=p.quiet, env=e)
+    # When output isn't going to a terminal, there's no need to flush it line
+    # by line. Printer will still flush at least every few milliseconds.
+    buffer_size = None if sys.stdout.isatty() else 65536
+
+    if args.engine == 'select' and compat.ON_WINDOWS:
+        raise CommandError("The 'select' engine is not available on Windows")
+
+    printer = Printer(sys.stdout,
+                      colour=(not args.no_colour),
+                      prefix=(not args.no_prefix),
+                      buffer_size=buffer_size,
+                      elapsed=args.elapsed)
+    manager_ctor = SelectorManager if args.engine == 'select' else Manager
+    manager = manager_ctor(printer,
+                          backlog=args.backlog,
+                          overflow=args.overflow)
+
+    for p in _expand_processes(args,
+                               processes,
+                               concurrency=concurrency,
+                               env=app_env,
+                               quiet=quiet,
+                               port=port):
+        e = environ.LayeredEnv(p.env, os.environ)
+        manager.add_process(p.name, p.cmd, quiet=p.quiet, env=e,
+                            rate_limit=rate_limits.get(p.name.rsplit('.', 1)[0]),
+                            max_line_length=args.max_line_length,
+                            truncate_lines=args.truncate_lines,
+                            quiet_log=_quiet_log(args.quiet_log, p),
+                            direct_exec=args.direct_exec)
 
     manager.loop()
     sys.exit(manager.returncode)
@@ -267,10 +351,54 @@ parser_start.add_argument(
     '-c', '--concurrency',
     help='the number of each process type to run.',
     type=str, metavar='process=num,process=num')
+_add_port_args(parser_start)
 parser_start.add_argument(
     '-q', '--quiet',
     help='process names for which to suppress output',
     type=str, metavar='process1,process2,process3')
+parser_start.add_argument(
+    '--elapsed',
+    help='print the time elapsed since honcho started rather than the time '
+         'of day',
+    action='store_true')
+parser_start.add_argument(
+    '--engine',
+    help='supervise each process from a forked copy of honcho (fork), or all '
+         'of them directly from honcho itself (select; not on Windows). '
+         'The latter starts large numbers of processes much faster '
+         '(default: fork)',
+    choices=ENGINES, default='fork')
+parser_start.add_argument(
+    '--direct-exec',
+    help='run commands which use no shell syntax directly, without /bin/sh',
+    action='store_true')
+parser_start.add_argument(
+    '--quiet-log',
+    help='write the output of quiet processes to DIR/NAME.log rather than '
+         'discarding it',
+    metavar='DIR')
+parser_start.add_argument(
+    '--rate-limit',
+    help='the most lines of output per second to print from each process of '
+         'a type',
+    type=str, metavar='process=num/s,process=num/s')
+parser_start.add_argument(
+    '--max-line-length',
+    help='split lines of output longer than N bytes (default: unlimited)',
+    type=_positive_int, metavar='N')
+parser_start.add_argument(
+    '--truncate-lines',
+    help='truncate overlong lines rather than splitting them',
+    action='store_true')
+parser_start.add_argument(
+    '--backlog',
+    help='the most output to hold waiting to be printed for each process '
+         '(default: unlimited)',
+    type=_positive_int, metavar='N')
+parser_start.add_argument(
+    '--overflow',
+    help='what to do with a process whose backlog is full (default: block)',
+    choices=OVERFLOW_POLICIES, default='block')
 parser_start.add_argument(
     'processes', nargs='*',
     help='process(es) to start (default: all processes)')
@@ -343,16 +471,96 @@ def _port(env):
 
 
 def _read_env(app_root, env):
-    files = [e.strip() for e in env.split(',')]
+    paths = [os.path.join(app_root, e.strip()) for e in env.split(',')]
+
+    # The same files are often read more than once in a single invocation, so
+    # parse them only once for as long as they are unchanged.
+    key = tuple((path, _file_version(path)) for path in paths)
+    values = _env_cache.get(key)
+    if values is None:
+        values = _env_cache[key] = _load_env(paths, key)
+    return dict(values)
+
+
+_env_cache = {}
+
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load_env(paths, key):
+    # If HONCHO_ENV_CACHE names a directory, keep the parsed contents of
+    # environment files there, to save parsing them again next time.
+    cache_dir = _env_cache_dir()
+    if cache_dir:
+        import hashlib
+        import json
+        digest = hashlib.sha1(repr([ENV_CACHE_VERSION, __version__] +
+                                   [(os.path.abspath(p), v) for p, v in key])
+                              .encode('utf-8')).hexdigest()
+        cache_path = os.path.join(cache_dir, digest + '.json')
+        try:
+            with open(cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
     content = []
-    for envfile in files:
+    for path in paths:
         try:
-            with open(os.path.join(app_root, envfile)) as f:
+            with open(path) as f:
                 content.append(f.read())
         except IOError:
             pass
+    values = environ.parse('\n'.join(content))
 
-    return environ.parse('\n'.join(content))
+    if cache_dir:
+        # Environment files often hold secrets, so make sure nobody else can
+        # read them from the cache.
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, 'w') as f:
+                json.dump(values, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            log.warning("Could not write environment cache: %s", e)
+    return values
+
+
+def _env_cache_dir():
+    cache_dir = os.environ.get('HONCHO_ENV_CACHE')
+    if not cache_dir:
+        return None
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.stat(cache_dir)
+    except OSError as e:
+        log.warning("Could not use environment cache: %s", e)
+        return None
+    # Anyone else who could write to the cache could plant variables in it.
+    if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        log.warning("Not using environment cache '%s': it must be a directory "
+                    "which only you can write to", cache_dir)
+        return None
+    return cache_dir
+
+
+def _expand_processes(args, processes, **kwargs):
+    try:
+        allocator = PortAllocator(args.port_strategy, args.port_stride,
+                                  probe=args.probe_ports)
+        result = environ.expand_processes(processes, allocator=allocator, **kwargs)
+    except ValueError as e:
+        raise CommandError(str(e))
+    if result.ports:
+        log.info('Allocated ports (%s)', describe(result.ports))
+    return result
 
 
 def _parse_concurrency(desc):
@@ -373,6 +581,33 @@ def _parse_quiet(desc):
     return result
 
 
+def _quiet_log(directory, process):
+    if directory is None or not process.quiet:
+        return None
+    _mkdir(directory)
+    return os.path.join(directory, process.name + '.log')
+
+
+def _parse_rate_limit(desc):
+    result = {}
+    if desc is None:
+        return result
+    for item in desc.split(','):
+        try:
+            key, rate = item.split('=', 1)
+            if rate.endswith('/s'):
+                rate = rate[:-2]
+            rate = float(rate)
+            if not 0 < rate < math.inf:
+                raise ValueError
+            result[key] = rate
+        except ValueError:
+            raise CommandError("Invalid rate limit '{0}': expected "
+                               "process=num/s, with num greater than "
+                               "0".format(item))
+    return result
+
+
 def _mkdir(path):
     if os.path.exists(path):
         return
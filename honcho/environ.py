@@ -1,10 +1,32 @@
+import bisect
 import os
 import re
-import shlex
-from collections import OrderedDict, defaultdict, namedtuple
+from collections import ChainMap, OrderedDict, defaultdict, namedtuple
+from collections.abc import Sequence
+from types import MappingProxyType
+
+from .ports import PortAllocator
 
 PROCFILE_LINE = re.compile(r'^([A-Za-z0-9_-]+):\s*(.+)$')
 
+# The characters which make up words, and which separate them, in a .env file.
+# These are the same as those used by :class:`shlex.shlex` in POSIX mode.
+ENV_WORDCHARS = frozenset('abcdfeghijklmnopqrstuvwxyz'
+                          'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'
+                          'ßàáâãäåæçèéêëìíîïðñòóôõöøùúûüýþÿ'
+                          'ÀÁÂÃÄÅÆÇÈÉÊËÌÍÎÏÐÑÒÓÔÕÖØÙÚÛÜÝÞ')
+ENV_WHITESPACE = frozenset(' \t\r\n')
+ENV_NAME = re.compile(r'[A-Za-z_][A-Za-z_0-9]*')
+
+# Most lines of a .env file are simple assignments, with a value which is
+# either unquoted or quoted without escapes, optionally followed by a comment.
+# Lines matching this are handled without tokenizing them.
+ENV_ASSIGNMENT = re.compile(r'''[ \t]*([A-Za-z_][A-Za-z_0-9]*)[ \t]*=[ \t]*'''
+                            r'''(?:([^\s'"\\#]+)|'([^']*)'|"([^"\\]*)")'''
+                            r'''[ \t]*(?:#.*)?$''')
+
+_DOUBLE_QUOTE_SPECIAL = re.compile(r'["\\]')
+
 
 class Env(object):
 
@@ -57,40 +79,135 @@ def parse(content):
     """
     values = {}
     for line in content.splitlines():
-        lexer = shlex.shlex(line, posix=True)
-        tokens = list(lexer)
+        m = ENV_ASSIGNMENT.match(line)
+        if m:
+            name, value = m.group(1), m.group(m.lastindex)
+        else:
+            tokens = _tokenize(line)
 
-        # parses the assignment statement
-        if len(tokens) < 3:
-            continue
+            # parses the assignment statement
+            if len(tokens) < 3:
+                continue
 
-        name, op = tokens[:2]
-        value = ''.join(tokens[2:])
+            name, op = tokens[:2]
+            value = ''.join(tokens[2:])
 
-        if op != '=':
-            continue
-        if not re.match(r'[A-Za-z_][A-Za-z_0-9]*', name):
-            continue
+            if op != '=':
+                continue
+            if not ENV_NAME.match(name):
+                continue
 
-        value = value.replace(r'\n', '\n')
-        value = value.replace(r'\t', '\t')
+        if '\\' in value:
+            value = value.replace(r'\n', '\n')
+            value = value.replace(r'\t', '\t')
         values[name] = value
 
     return values
 
 
+def _tokenize(line):
+    """
+    Split a line of a .env file into tokens, exactly as
+    ``list(shlex.shlex(line, posix=True))`` would, in a single pass over the
+    line: runs of word characters form words, quotes and backslash escapes
+    may appear anywhere in a word, a '#' starts a comment, and any other
+    character which isn't whitespace is a token of its own.
+    """
+    tokens = []
+    token = None
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c in ENV_WORDCHARS:
+            j = i + 1
+            while j < n and line[j] in ENV_WORDCHARS:
+                j += 1
+            token = line[i:j] if token is None else token + line[i:j]
+            i = j
+            continue
+        if c in ENV_WHITESPACE:
+            if token is not None:
+                tokens.append(token)
+                token = None
+        elif c == '#':
+            break
+        elif c == '\\':
+            i += 1
+            if i == n:
+                raise ValueError("No escaped character")
+            token = line[i] if token is None else token + line[i]
+        elif c == "'":
+            j = line.find("'", i + 1)
+            if j < 0:
+                raise ValueError("No closing quotation")
+            token = line[i + 1:j] if token is None else token + line[i + 1:j]
+            i = j
+        elif c == '"':
+            chunks = [] if token is None else [token]
+            i += 1
+            while True:
+                j = _DOUBLE_QUOTE_SPECIAL.search(line, i)
+                if j is None:
+                    raise ValueError("No closing quotation")
+                j = j.start()
+                chunks.append(line[i:j])
+                if line[j] == '"':
+                    break
+                # Within double quotes, a backslash only escapes a double
+                # quote or another backslash.
+                if j + 1 == n:
+                    raise ValueError("No escaped character")
+                escaped = line[j + 1]
+                chunks.append(escaped if escaped in '"\\' else '\\' + escaped)
+                i = j + 2
+            token = ''.join(chunks)
+            i = j
+        else:
+            if token is not None:
+                tokens.append(token)
+                token = None
+            tokens.append(c)
+        i += 1
+    if token is not None:
+        tokens.append(token)
+    return tokens
+
+
+class LayeredEnv(ChainMap):
+    """
+    An environment made up of a stack of layers, such as a small per-process
+    overlay on top of the application's environment on top of `os.environ`.
+    Lookups search each layer in turn, and changes are only ever made to the
+    first, so the layers below it can be shared by any number of processes
+    without being copied.
+
+    A LayeredEnv should be materialised (with `dict(env)`) when a process is
+    spawned. It is also materialised when pickled, as `os.environ` can't be.
+    """
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
 ProcessParams = namedtuple("ProcessParams", "name cmd quiet env")
 
 
-def expand_processes(processes, concurrency=None, env=None, quiet=None, port=None):
+def expand_processes(processes, concurrency=None, env=None, quiet=None, port=None,
+                     allocator=None):
     """
     Get a list of the processes that need to be started given the specified
     list of process types, concurrency, environment, quietness, and base port
-    number.
-
-    Returns a list of ProcessParams objects, which have `name`, `cmd`, `env`,
-    and `quiet` attributes, corresponding to the parameters to the constructor
-    of `honcho.process.Process`.
+    number. Ports are allocated to the processes from the base port by the
+    given `allocator`, a :class:`~honcho.ports.PortAllocator` (or a default
+    one).
+
+    Returns a read-only sequence of ProcessParams objects, which have `name`,
+    `cmd`, `env`, and `quiet` attributes, corresponding to the parameters to
+    the constructor of `honcho.process.Process`. Each ProcessParams is only
+    made when it is needed, and each `env` is a :class:`LayeredEnv`, sharing
+    the given `env` (which mustn't be changed afterwards) with the others.
+    The ports allocated to each process type are in its `ports` attribute.
     """
     if env is not None and env.get("PORT") is not None:
         port = int(env.get("PORT"))
@@ -102,22 +219,74 @@ def expand_processes(processes, concurrency=None, env=None, quiet=None, port=Non
     if concurrency is not None:
         con.update(concurrency)
 
-    out = []
-
-    for name, cmd in processes.items():
-        for i in range(con[name]):
-            n = "{0}.{1}".format(name, i + 1)
-            c = cmd
-            q = name in quiet
-            e = {'HONCHO_PROCESS_NAME': n}
-            if env is not None:
-                e.update(env)
-            if port is not None:
-                e['PORT'] = str(port + i)
-
-            params = ProcessParams(n, c, q, e)
-            out.append(params)
-        if port is not None:
-            port += 100
-
-    return out
+    counts = [con[name] for name in processes]
+    if port is not None:
+        if allocator is None:
+            allocator = PortAllocator()
+        allocated = allocator.allocate(port, counts)
+    else:
+        allocated = [None] * len(counts)
+
+    types = [(name, cmd, count, name in quiet, p)
+             for (name, cmd), count, p in zip(processes.items(), counts, allocated)]
+
+    return _ProcessList(types, env)
+
+
+class _ProcessList(Sequence):
+    """
+    The processes returned by :func:`expand_processes`: a sequence of the
+    instances of each of a number of process types, each described by a tuple
+    of its name, command, concurrency, quietness, and ports (or None).
+    """
+
+    def __init__(self, types, env):
+        self._types = types
+        self._env = MappingProxyType(env) if env is not None else None
+
+        # The index of the first instance of each process type.
+        self._starts = []
+        total = 0
+        for t in types:
+            self._starts.append(total)
+            total += t[2]
+        self._len = total
+
+        #: The ports allocated to the instances of each process type, as a
+        #: list of pairs of its name and a sequence of ports.
+        self.ports = [(t[0], t[4]) for t in types if t[4] is not None]
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("process index out of range")
+        t = bisect.bisect_right(self._starts, index) - 1
+        return self._params(self._types[t], index - self._starts[t])
+
+    def __iter__(self):
+        for t in self._types:
+            for i in range(t[2]):
+                yield self._params(t, i)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(self.__class__.__name__, list(self))
+
+    def _params(self, type, i):
+        name, cmd, _, quiet, ports = type
+        n = "{0}.{1}".format(name, i + 1)
+        e = LayeredEnv({'PORT': str(ports[i])} if ports is not None else {})
+        if self._env is not None:
+            e.maps.append(self._env)
+        e.maps.append({'HONCHO_PROCESS_NAME': n})
+        return ProcessParams(n, cmd, quiet, e)
@@ -1,13 +1,20 @@
-import datetime
+import collections
+import functools
+import math
 import multiprocessing
+import os
 import queue
+import selectors
 import signal
 import sys
+import time
 
+from . import clock
+from .channel import Channel
 from .colour import get_colours
 from .compat import ProcessManager
 from .printer import Message, Printer
-from .process import Process
+from .process import DRAIN_WAIT, Process
 
 KILL_WAIT = 5
 SIGNALS = {
@@ -22,6 +29,26 @@ SIGNALS = {
 }
 SYSTEM_PRINTER_NAME = 'system'
 
+#: What to do when a process produces more output than can be held pending
+#: printing: stop reading its output until there's room ('block'), or discard
+#: the oldest ('drop-oldest') or newest ('drop-newest') pending output.
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+# How often, in seconds, to report on output being dropped from a process which
+# persistently produces output faster than it can be printed.
+DROP_REPORT_INTERVAL = 5
+
+# How often, in seconds, to report on output suppressed by a process's rate
+# limit.
+SUPPRESS_REPORT_INTERVAL = 5
+
+# How often, in seconds, to check whether a process has exited where there is
+# nothing to select on that would tell us.
+POLL_INTERVAL = 0.1
+
+# The maximum number of events to receive before printing any of them.
+READ_AHEAD = 1024
+
 
 class Manager(object):
     """
@@ -46,12 +73,29 @@ class Manager(object):
     #: this will contain a return code that can be used with `sys.exit`.
     returncode = None
 
-    def __init__(self, printer=None):
-        self.events = multiprocessing.Queue()
+    #: After :func:`~honcho.manager.Manager.loop` finishes, this will contain
+    #: the time taken, in seconds, from starting to launch processes until all
+    #: had reported starting, or None if they never did. It is also printed
+    #: as soon as they have all started.
+    startup_time = None
+
+    #: The number of lines of output suppressed by each process's rate limit
+    #: (see :func:`~honcho.manager.Manager.add_process`), by process name.
+    suppressed = None
+
+    def __init__(self, printer=None, backlog=None, overflow='block'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("unknown overflow policy: '%s'" % overflow)
+        if backlog is not None and backlog < 1:
+            raise ValueError("invalid backlog: %s" % backlog)
+
+        self.events = Channel()
         self.returncode = None
+        self.startup_time = None
+        self.suppressed = {}
 
         self._colours = get_colours()
-        self._clock = datetime.datetime
+        self._clock = clock.Clock
         self._procmgr = ProcessManager()
 
         self._printer = printer if printer is not None else Printer(sys.stdout)
@@ -59,23 +103,55 @@ class Manager(object):
 
         self._process_ctor = Process
         self._processes = {}
-
+        self._started = 0
+        self._stopped = 0
+
+        # Events waiting to be handled are held per-process, with up to
+        # `backlog` batches of output held for each, and processes with events
+        # pending take turns in _ready. Lifecycle events which aren't queued
+        # behind any output, and signals, skip the queue in _priority.
+        self._backlog = backlog
+        self._overflow = overflow
+        self._ready = collections.deque()
+        self._priority = collections.deque()
+        # Processes with suppressed output yet to be reported, by name.
+        self._suppressing = {}
+
+        self._launched_at = None
         self._terminating = False
+        self._killed = False
 
-    def add_process(self, name, cmd, quiet=False, env=None, cwd=None):
+    def add_process(self, name, cmd, quiet=False, env=None, cwd=None,
+                    rate_limit=None, max_line_length=None, truncate_lines=False,
+                    quiet_log=None, direct_exec=False):
         """
         Add a process to this manager instance. The process will not be started
         until :func:`~honcho.manager.Manager.loop` is called.
+
+        The output of a `quiet` process is discarded, or appended to the file
+        named by `quiet_log`, without being read by Honcho at all.
+
+        If `rate_limit` is given, at most that many lines of output per second
+        (in bursts of up to a second's worth) will be printed from the
+        process. Any more are counted and periodically reported, but not
+        printed.
         """
         assert name not in self._processes, "process names must be unique"
+        bucket = _TokenBucket(rate_limit) if rate_limit is not None else None
         proc = self._process_ctor(cmd,
                                   name=name,
                                   quiet=quiet,
                                   colour=next(self._colours),
                                   env=env,
-                                  cwd=cwd)
-        self._processes[name] = {}
-        self._processes[name]['obj'] = proc
+                                  cwd=cwd,
+                                  max_line_length=max_line_length,
+                                  truncate_lines=truncate_lines,
+                                  quiet_log=quiet_log,
+                                  direct_exec=direct_exec)
+        self._processes[name] = _ProcessState(proc)
+        if bucket is not None:
+            self._processes[name].bucket = bucket
+            self.suppressed[name] = 0
 
         # Update printer width to accommodate this process name
         self._printer.width = max(self._printer.width, len(name))
@@ -91,53 +167,71 @@ class Manager(object):
         Honcho, and :func:`~honcho.manager.Manager.loop` will return.
 
         This method will block until all the processes have terminated.
+
+        Output is printed from each process in turn, so that a process which
+        produces a lot of output can't hold up output from the others. Process
+        starts and stops, and signals, are reported as soon as they arrive
+        unless there is earlier output from the same process still to print.
+
+        If the manager was created with a `backlog`, at most that many batches
+        of output from each process are held waiting to be printed. Beyond
+        that, depending on the `overflow` policy, the process is made to wait
+        until there is room for more ('block'), or output is discarded
+        ('drop-oldest' or 'drop-newest') and the number of lines dropped is
+        periodically reported.
         """
         def _terminate(signum, frame):
-            self._system_print("%s received\n" % SIGNALS[signum]['name'])
-            self.returncode = SIGNALS[signum]['rc']
-            self.terminate()
+            # Don't do any work in the signal handler itself: just post an
+            # event so that the signal is handled in order by the loop below.
+            self.events.put(Message(type='signal',
+                                    data={'signum': signum},
+                                    time=self._clock.now(),
+                                    name=None,
+                                    colour=None))
 
         signal.signal(signal.SIGTERM, _terminate)
         signal.signal(signal.SIGINT, _terminate)
 
+        self._launched_at = time.monotonic()
         self._start()
 
-        exit = False
-        exit_start = None
-
-        while 1:
-            try:
-                msg = self.events.get(timeout=0.1)
-            except queue.Empty:
-                if exit:
-                    break
-            else:
-                if msg.type == 'line':
-                    self._printer.write(msg)
-                elif msg.type == 'start':
-                    self._processes[msg.name]['pid'] = msg.data['pid']
-                    self._system_print("%s started (pid=%s)\n"
-                                       % (msg.name, msg.data['pid']))
-                elif msg.type == 'stop':
-                    self._processes[msg.name]['returncode'] = msg.data['returncode']
-                    self._system_print("%s stopped (rc=%s)\n"
-                                       % (msg.name, msg.data['returncode']))
-                    if self.returncode is None:
-                        self.returncode = msg.data['returncode']
-
-            if self._all_started() and self._all_stopped():
-                exit = True
-
-            if exit_start is None and self._all_started() and self._any_stopped():
-                exit_start = self._clock.now()
+        kill_at = None
+
+        while not (self._all_started() and self._all_stopped()):
+            # Block until the next event arrives, or until it's time to kill
+            # any children which have ignored our request to terminate. If
+            # there's output waiting to be printed, don't block at all.
+            timeout = None
+            if self._ready or self._priority:
+                timeout = 0
+            elif kill_at is not None:
+                timeout = max(0, (kill_at - self._clock.now()) / clock.NS_PER_SECOND)
+            # Nor beyond when suppressed output is next due to be reported,
+            # even if the process it's from has gone quiet.
+            if self._suppressing and timeout != 0:
+                report_at = min(p.suppressed_since for p in self._suppressing.values())
+                wait = max(0, report_at + SUPPRESS_REPORT_INTERVAL - time.monotonic())
+                timeout = wait if timeout is None else min(timeout, wait)
+
+            for msg in self._receive_events(timeout):
+                self._receive(msg)
+            self._dispatch()
+            for name, p in list(self._suppressing.items()):
+                self._report_suppressed(name, p)
+
+            if not self._terminating and self._all_started() and self._any_stopped():
                 self.terminate()
 
-            if exit_start is not None:
-                # If we've been in this loop for more than KILL_WAIT seconds,
-                # it's time to kill all remaining children.
-                waiting = self._clock.now() - exit_start
-                if waiting > datetime.timedelta(seconds=KILL_WAIT):
-                    self.kill()
+            if self._terminating and kill_at is None and not self._killed:
+                kill_at = self._clock.now() + KILL_WAIT * clock.NS_PER_SECOND
+
+            if kill_at is not None and self._clock.now() >= kill_at:
+                # If we've been waiting for more than KILL_WAIT seconds, it's
+                # time to kill all remaining children.
+                self.kill()
+                kill_at = None
+
+        self._flush_printer()
 
     def terminate(self):
         """
@@ -152,6 +246,7 @@ class Manager(object):
         """
         Kill all processes managed by this ProcessManager.
         """
+        self._killed = True
         self._killall(force=True)
 
     def _killall(self, force=False):
@@ -159,34 +254,221 @@ class Manager(object):
         for_termination = []
 
         for n, p in self._processes.items():
-            if 'returncode' not in p:
+            if p.returncode is None:
                 for_termination.append(n)
 
         for n in for_termination:
             p = self._processes[n]
             signame = 'SIGKILL' if force else 'SIGTERM'
             self._system_print("sending %s to %s (pid %s)\n" %
-                               (signame, n, p['pid']))
+                               (signame, n, p.pid))
             if force:
-                self._procmgr.kill(p['pid'])
+                self._procmgr.kill(p.pid)
             else:
-                self._procmgr.terminate(p['pid'])
+                self._procmgr.terminate(p.pid)
 
     def _start(self):
         for name, p in self._processes.items():
-            p['process'] = multiprocessing.Process(name=name,
-                                                   target=p['obj'].run,
-                                                   args=(self.events, True))
-            p['process'].start()
+            self.events.register(name, p.obj.colour)
+        for name, p in self._processes.items():
+            kwargs = {}
+            if self._backlog is not None and self._overflow == 'block':
+                p.credits = kwargs['credits'] = multiprocessing.Semaphore(self._backlog)
+            p.process = multiprocessing.Process(name=name,
+                                                target=p.obj.run,
+                                                args=(self.events, True),
+                                                kwargs=kwargs)
+            p.process.start()
+
+    def _receive_events(self, timeout):
+        """
+        Wait up to `timeout` seconds for an event, and then return it along with
+        any others which are immediately available.
+        """
+        events = []
+        try:
+            events.append(self._wait_event(timeout))
+            while len(events) < READ_AHEAD:
+                events.append(self._next_event(timeout=0))
+        except queue.Empty:
+            pass
+        return events
+
+    def _wait_event(self, timeout):
+        try:
+            return self._next_event(timeout=0)
+        except queue.Empty:
+            if timeout == 0:
+                raise
+            # We're about to go idle, so make sure that everything printed so
+            # far has actually been written out.
+            self._flush_printer()
+        return self._next_event(timeout=timeout)
+
+    def _receive(self, msg):
+        """
+        Queue an event for the process it refers to, applying the overflow
+        policy if the process has too much output pending.
+        """
+        if msg.type == 'signal':
+            self._priority.append(msg)
+            return
+
+        p = self._processes[msg.name]
+        if msg.type == 'line' and p.bucket is not None:
+            msg = self._rate_limit(p, msg)
+            if msg is None:
+                # None of it will be dispatched, so return its credit now.
+                if p.credits is not None:
+                    p.credits.release()
+                return
+
+        if msg.type != 'line' and not p.pending:
+            self._priority.append(msg)
+            return
+
+        if msg.type == 'line' and self._backlog is not None:
+            if p.lines >= self._backlog and self._overflow == 'drop-newest':
+                p.dropped += _count_lines(msg.data)
+                return
+            if p.lines >= self._backlog and self._overflow == 'drop-oldest':
+                for i, old in enumerate(p.pending):
+                    if old.type == 'line':
+                        del p.pending[i]
+                        p.lines -= 1
+                        p.dropped += _count_lines(old.data)
+                        break
+
+        if not p.pending:
+            self._ready.append(msg.name)
+        p.pending.append(msg)
+        if msg.type == 'line':
+            p.lines += 1
+            if (self._backlog is not None and self._overflow == 'block'
+                    and p.lines >= self._backlog):
+                self._pause_output(p)
+
+    def _rate_limit(self, p, msg):
+        """
+        Return as much of the output in `msg` as the process's rate limit
+        allows, or None if it allows none of it.
+        """
+        name = msg.name
+        count = _count_lines(msg.data)
+        allowed = p.bucket.take(count)
+        if allowed < count:
+            if not p.suppressed:
+                p.suppressed_since = time.monotonic()
+                self._suppressing[name] = p
+            p.suppressed += count - allowed
+            self.suppressed[name] += count - allowed
+            msg = msg._replace(data=_head_lines(msg.data, allowed)) if allowed else None
+        self._report_suppressed(name, p)
+        return msg
+
+    def _report_suppressed(self, name, p, force=False):
+        if not p.suppressed:
+            return
+        elapsed = time.monotonic() - p.suppressed_since
+        if force or elapsed >= SUPPRESS_REPORT_INTERVAL:
+            self._system_print("%s: %d lines suppressed in last %.0fs\n"
+                               % (name, p.suppressed, elapsed))
+            p.suppressed = 0
+            self._suppressing.pop(name, None)
+
+    def _dispatch(self):
+        """
+        Handle all the priority events waiting to be handled, and then the next
+        event for the process whose turn it is, if there is one.
+        """
+        while self._priority:
+            msg = self._priority.popleft()
+            if msg.type == 'stop':
+                self._report_dropped(msg.name, self._processes[msg.name], force=True)
+                self._report_suppressed(msg.name, self._processes[msg.name], force=True)
+            self._handle(msg)
+
+        if not self._ready:
+            return
+
+        name = self._ready.popleft()
+        p = self._processes[name]
+        msg = p.pending.popleft()
+        if p.pending:
+            self._ready.append(name)
+
+        if msg.type == 'line':
+            p.lines -= 1
+            if p.credits is not None:
+                p.credits.release()
+            self._resume_output(p)
+        elif msg.type == 'stop':
+            self._report_dropped(name, p, force=True)
+            self._report_suppressed(name, p, force=True)
+
+        self._handle(msg)
+        self._report_dropped(name, p)
+
+    def _handle(self, msg):
+        if msg.type == 'line':
+            self._printer.write(msg)
+        elif msg.type == 'start':
+            p = self._processes[msg.name]
+            if p.pid is None:
+                self._started += 1
+            p.pid = msg.data['pid']
+            self._system_print("%s started (pid=%s)\n"
+                               % (msg.name, msg.data['pid']))
+            if self.startup_time is None and self._all_started():
+                self.startup_time = time.monotonic() - self._launched_at
+                self._system_print("all processes started in %.3fs\n"
+                                   % self.startup_time)
+        elif msg.type == 'stop':
+            p = self._processes[msg.name]
+            if p.returncode is None:
+                self._stopped += 1
+            p.returncode = msg.data['returncode']
+            self._system_print("%s stopped (rc=%s)\n"
+                               % (msg.name, msg.data['returncode']))
+            if self.returncode is None:
+                self.returncode = msg.data['returncode']
+        elif msg.type == 'signal':
+            signum = msg.data['signum']
+            self._system_print("%s received\n" % SIGNALS[signum]['name'])
+            self.returncode = SIGNALS[signum]['rc']
+            self.terminate()
+
+    def _report_dropped(self, name, p, force=False):
+        # Report dropped output once the process's backlog has cleared, or
+        # every so often if it never does.
+        if not p.dropped:
+            return
+        now = time.monotonic()
+        if force or not p.lines or now - p.reported >= DROP_REPORT_INTERVAL:
+            self._system_print("%s: %d lines dropped\n" % (name, p.dropped))
+            p.dropped = 0
+            p.reported = now
+
+    def _pause_output(self, p):
+        # With the 'block' overflow policy, each process acquires a credit for
+        # each batch of output it sends (see _start), so there's nothing more
+        # to do here.
+        pass
+
+    def _resume_output(self, p):
+        pass
+
+    def _next_event(self, timeout):
+        return self.events.get(timeout=timeout)
 
     def _all_started(self):
-        return all(p.get('pid') is not None for _, p in self._processes.items())
+        return self._started == len(self._processes)
 
     def _all_stopped(self):
-        return all(p.get('returncode') is not None for _, p in self._processes.items())
+        return self._stopped == len(self._processes)
 
     def _any_stopped(self):
-        return any(p.get('returncode') is not None for _, p in self._processes.items())
+        return self._stopped > 0
 
     def _system_print(self, data):
         self._printer.write(Message(type='line',
@@ -194,3 +476,222 @@ class Manager(object):
                                     time=self._clock.now(),
                                     name=SYSTEM_PRINTER_NAME,
                                     colour=None))
+        self._flush_printer()
+
+    def _flush_printer(self):
+        # Printers need not support buffering.
+        flush = getattr(self._printer, 'flush', None)
+        if flush is not None:
+            flush()
+
+
+class SelectorManager(Manager):
+    """
+    SelectorManager is a :class:`Manager` which runs each process as a direct
+    child of the current Python process, rather than forking a separate Python
+    process to supervise each one, and multiplexes their output using
+    :mod:`selectors`. This makes it considerably cheaper to run large numbers
+    of processes.
+
+    Processes are launched with :class:`subprocess.Popen`, which (on recent
+    versions of Python) uses vfork or posix_spawn to do so, avoiding the cost
+    of copying the address space of a large Python process for each one.
+
+    Because it relies on being able to select on pipes, SelectorManager is not
+    available on Windows.
+    """
+
+    def __init__(self, printer=None, backlog=None, overflow='block'):
+        super(SelectorManager, self).__init__(printer=printer,
+                                              backlog=backlog,
+                                              overflow=overflow)
+        self.events = queue.SimpleQueue()
+        self._selector = selectors.DefaultSelector()
+        self._draining = {}
+        self._reading = set()
+        self._paused = set()
+        self._polling = set()
+
+    def loop(self):
+        # Signal handlers post their events to a queue.SimpleQueue, which is
+        # safe to do from a signal handler, but that alone won't wake us from
+        # select(). Route signal wakeups through a pipe that we also select on.
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        self._selector.register(wakeup_r, selectors.EVENT_READ,
+                                functools.partial(_drain, wakeup_r))
+        old_wakeup_fd = signal.set_wakeup_fd(wakeup_w)
+        try:
+            super(SelectorManager, self).loop()
+        finally:
+            signal.set_wakeup_fd(old_wakeup_fd)
+            self._selector.unregister(wakeup_r)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+    def _start(self):
+        for name, p in self._processes.items():
+            proc = p.obj
+            proc.spawn(self.events)
+            if proc.fileno() is not None:
+                self._register_output(proc)
+            if proc.exit_fileno() is not None:
+                self._selector.register(proc.exit_fileno(),
+                                        selectors.EVENT_READ,
+                                        functools.partial(self._on_exit, proc))
+            elif proc.fileno() is None:
+                self._polling.add(proc)
+
+    def _next_event(self, timeout):
+        if self.events.empty():
+            if self._draining:
+                wait = max(0, min(self._draining.values()) - time.monotonic())
+                timeout = wait if timeout is None else min(timeout, wait)
+            if self._polling:
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            for key, _ in self._selector.select(timeout):
+                key.data()
+            for proc in list(self._polling):
+                if proc.poll() is not None:
+                    self._finish(proc)
+            now = time.monotonic()
+            for proc, drain_until in list(self._draining.items()):
+                if now >= drain_until and proc not in self._paused:
+                    self._finish(proc)
+        return self.events.get_nowait()
+
+    def _register_output(self, proc):
+        self._selector.register(proc.fileno(),
+                                selectors.EVENT_READ,
+                                functools.partial(self._on_output, proc))
+        self._reading.add(proc)
+
+    def _pause_output(self, p):
+        # Stop reading from the process until its backlog has cleared. It will
+        # block once the pipe buffer between us fills.
+        proc = p.obj
+        if proc in self._reading:
+            self._selector.unregister(proc.fileno())
+            self._reading.discard(proc)
+            self._paused.add(proc)
+
+    def _resume_output(self, p):
+        proc = p.obj
+        if proc in self._paused:
+            self._paused.discard(proc)
+            self._register_output(proc)
+            if proc in self._draining:
+                self._draining[proc] = time.monotonic() + DRAIN_WAIT
+
+    def _on_output(self, proc):
+        if proc.read():
+            return
+        # The child has closed its output, but may well still be running.
+        # Waiting for it here would hold up every other process, so stop
+        # reading from it and leave it to be reaped once it has exited.
+        self._selector.unregister(proc.fileno())
+        self._reading.discard(proc)
+        if proc in self._draining or proc.poll() is not None:
+            self._finish(proc)
+        elif proc.exit_fileno() is None:
+            self._polling.add(proc)
+
+    def _on_exit(self, proc):
+        # The child has exited, but its output pipe may be held open by a
+        # grandchild. Give it DRAIN_WAIT seconds to reach EOF before giving up
+        # on it.
+        if proc.exit_fileno() is None:
+            # Already finished earlier in this round of events.
+            return
+        self._selector.unregister(proc.exit_fileno())
+        proc.reap()
+        if proc not in self._reading and proc not in self._paused:
+            # There's no more output to wait for.
+            self._finish(proc)
+        else:
+            self._draining[proc] = time.monotonic() + DRAIN_WAIT
+
+    def _finish(self, proc):
+        if proc in self._reading:
+            self._selector.unregister(proc.fileno())
+            self._reading.discard(proc)
+        self._paused.discard(proc)
+        self._polling.discard(proc)
+        if proc.exit_fileno() is not None:
+            self._selector.unregister(proc.exit_fileno())
+        self._draining.pop(proc, None)
+        proc.finish()
+
+
+class _ProcessState(object):
+    """
+    The state of a managed process: its lifecycle so far, and its events which
+    are waiting to be handled.
+    """
+
+    __slots__ = ('bucket', 'credits', 'dropped', 'lines', 'obj', 'pending',
+                 'pid', 'process', 'reported', 'returncode', 'suppressed',
+                 'suppressed_since')
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.pid = None
+        self.returncode = None
+        # The multiprocessing.Process (or asyncio transport) running it.
+        self.process = None
+        self.credits = None
+        self.pending = collections.deque()
+        self.lines = 0
+        self.dropped = 0
+        self.reported = time.monotonic()
+        self.bucket = None
+        self.suppressed = 0
+        self.suppressed_since = None
+
+
+def _count_lines(data):
+    # Count the lines in a batch of output, which will always end in a newline
+    # unless it is the last output from its process.
+    return data.count(b'\n' if isinstance(data, bytes) else '\n') or 1
+
+
+def _head_lines(data, count):
+    # Return the first `count` lines of a batch of output.
+    end = -1
+    newline = b'\n' if isinstance(data, bytes) else '\n'
+    for _ in range(count):
+        end = data.index(newline, end + 1)
+    return data[:end + 1]
+
+
+class _TokenBucket(object):
+    """
+    Allows up to `rate` lines per second, in bursts of up to a second's worth.
+    """
+
+    __slots__ = ('rate', 'tokens', 'updated')
+
+    def __init__(self, rate):
+        if not 0 < rate < math.inf:
+            raise ValueError("invalid rate limit: %s" % rate)
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self, count):
+        """Take up to `count` tokens, returning how many were taken."""
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        taken = min(count, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
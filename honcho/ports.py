@@ -0,0 +1,114 @@
+"""
+Honcho gives each instance of each process type its own port number, in the
+PORT environment variable. A :class:`PortAllocator` decides which, before any
+processes are started, so that no two instances are ever given the same port,
+however many of them there are.
+"""
+from .compat import ON_WINDOWS
+
+STRATEGIES = ('stride', 'pack')
+
+DEFAULT_STRIDE = 100
+
+MAX_PORT = 65535
+
+
+class PortAllocator(object):
+    """
+    Allocate ports to the instances of a number of process types, starting
+    from a base port number.
+
+    With the 'stride' strategy (the default), the instances of each process
+    type are given consecutive ports starting from a multiple of `stride`
+    above the base port: with a stride of 100, the instances of the first type
+    are given ports from 5000, and those of the second ports from 5100. A
+    process type with more than `stride` instances takes up as many multiples
+    of `stride` as it needs, so those of the next type start from (say) 5200
+    instead. With the 'pack' strategy, the instances of each process type are
+    instead given the ports immediately following those of the type before it.
+
+    If `probe` is true, ports which are already in use on this host (those
+    which can't be bound on `host`) are skipped over.
+    """
+
+    def __init__(self, strategy='stride', stride=DEFAULT_STRIDE, probe=False,
+                 host='127.0.0.1'):
+        if strategy not in STRATEGIES:
+            raise ValueError("invalid port strategy: '{0}'".format(strategy))
+        if stride < 1:
+            raise ValueError("invalid port stride: {0}".format(stride))
+        self.strategy = strategy
+        self.stride = stride
+        self.probe = probe
+        self.host = host
+
+    def allocate(self, base, counts):
+        """
+        Return a list containing a sequence of ports for each of the given
+        numbers of instances, starting from the port `base`. Raises ValueError
+        if there aren't enough ports to go around.
+        """
+        result = []
+        start = base
+        for count in counts:
+            if self.probe:
+                ports = []
+                port = start
+                while len(ports) < count:
+                    if port > MAX_PORT:
+                        raise ValueError("not enough free ports from {0}"
+                                         .format(base))
+                    if self.is_free(port):
+                        ports.append(port)
+                    port += 1
+                end = port
+            else:
+                ports = range(start, start + count)
+                end = start + count
+                if count and end - 1 > MAX_PORT:
+                    raise ValueError("not enough ports from {0}".format(base))
+            result.append(ports)
+
+            if self.strategy == 'pack':
+                start = end
+            else:
+                strides = max(1, -(-(end - start) // self.stride))
+                start += strides * self.stride
+        return result
+
+    def is_free(self, port):
+        """Return whether `port` can be bound on this allocator's host."""
+        # Imported here, as honcho only needs it when probing for free ports.
+        import socket
+
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            # Servers usually set SO_REUSEADDR, so a port with connections
+            # lingering in TIME_WAIT is free as far as they are concerned.
+            # (On Windows, it would allow binding a port which is in use.)
+            if not ON_WINDOWS:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind((self.host, port))
+            except OSError:
+                return False
+        return True
+
+
+def describe(assignment):
+    """
+    Describe an assignment of ports to process types, given as pairs of each
+    type's name and its ports, as in 'web: 5000-5149, 5151; worker: 5200'.
+    """
+    parts = []
+    for name, ports in assignment:
+        ranges = []
+        for port in ports:
+            if ranges and ranges[-1][1] == port - 1:
+                ranges[-1][1] = port
+            else:
+                ranges.append([port, port])
+        if not ranges:
+            continue
+        parts.append('{0}: {1}'.format(name, ', '.join(
+            str(a) if a == b else '{0}-{1}'.format(a, b) for a, b in ranges)))
+    return '; '.join(parts)
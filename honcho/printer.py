@@ -1,6 +1,9 @@
+import codecs
 import sys
+import time
 from collections import namedtuple
 
+from . import clock
 from .compat import ON_WINDOWS
 
 Message = namedtuple("Message", "type data time name colour")
@@ -11,6 +14,16 @@ class Printer(object):
     Printer is where Honcho's user-visible output is defined. A Printer
     instance receives typed messages and prints them to its output (usually
     STDOUT) in the Honcho format.
+
+    By default every line is written and flushed to the output immediately. If
+    `buffer_size` is given, lines are instead accumulated and written out in
+    one go when more than `buffer_size` characters are pending, when
+    `flush_interval` seconds have passed since the oldest pending line was
+    written, or when :func:`~honcho.printer.Printer.flush` is called.
+
+    Message times are timestamps from :func:`honcho.clock.now` (or datetimes),
+    printed using `time_format` or, if `elapsed` is set, as the time elapsed
+    since Honcho started, as in '+12.345s'.
     """
 
     def __init__(self,
@@ -18,12 +31,18 @@ class Printer(object):
                  time_format="%H:%M:%S",
                  width=0,
                  colour=True,
-                 prefix=True):
+                 prefix=True,
+                 buffer_size=None,
+                 flush_interval=0.02,
+                 elapsed=False):
         self.output = output
         self.time_format = time_format
         self.width = width
         self.colour = colour
         self.prefix = prefix
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.elapsed = elapsed
 
         try:
             # We only want to print coloured messages if the given output supports
@@ -34,14 +53,34 @@ class Printer(object):
             # is not able to handle ANSI escape sequences.
             self._colours_supported = False
 
+        self._prefix_cache = {}
+
+        # If the output is a text stream wrapping a binary buffer (as
+        # sys.stdout usually is), keep hold of the buffer so that we can write
+        # bytes to it directly when that saves work. On Windows we always
+        # write text, to benefit from newline translation and colorama.
+        self._binary_output = None
+        self._encoding = getattr(self.output, 'encoding', None) or 'utf-8'
+        self._utf8 = codecs.lookup(self._encoding).name == 'utf-8'
+        if not ON_WINDOWS:
+            self._binary_output = getattr(self.output, 'buffer', None)
+        self._decoders = {}
+
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_since = None
+
     def write(self, message):
         if message.type != 'line':
             raise RuntimeError('Printer can only process messages of type "line"')
 
-        name = message.name if message.name is not None else ""
-        name = name.ljust(self.width)
-        if name:
-            name += " "
+        if self._binary_output is not None:
+            if not self.prefix:
+                self._write_passthrough(message)
+                return
+            if self._utf8:
+                self._write_bytes(message)
+                return
 
         # When encountering data that cannot be interpreted as UTF-8 encoded
         # Unicode, Printer will replace the unrecognisable bytes with the
@@ -51,22 +90,141 @@ class Printer(object):
         else:
             string = message.data
 
-        for line in string.splitlines():
-            prefix = ''
-            if self.prefix:
-                time_formatted = message.time.strftime(self.time_format)
-                prefix = '{time} {name}| '.format(time=time_formatted, name=name)
-                if self.colour and self._colours_supported and message.colour:
-                    prefix = _colour_string(message.colour, prefix)
-            print(prefix + line, file=self.output, flush=True)
+        lines = string.splitlines()
+        if not lines:
+            return
+        prefix = self._prefix(message)[0] if self.prefix else ''
+        self._emit(prefix + ('\n' + prefix).join(lines) + '\n')
+
+    def _write_passthrough(self, message):
+        # Output from processes needs no transformation at all, so write it
+        # straight through to the underlying binary stream.
+        data = message.data
+        if not isinstance(data, bytes):
+            data = data.encode(self._encoding, 'replace')
+        if data and not data.endswith(b'\n'):
+            data += b'\n'
+        self._emit(data)
+
+    def _write_bytes(self, message):
+        # The output is UTF-8 encoded, so output from processes which is valid
+        # UTF-8 can be written as-is, without being decoded and re-encoded.
+        data = message.data
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        else:
+            decoder = self._decoders.get(message.name)
+            if decoder is not None or not _valid_utf8(data):
+                # Replace invalid data with U+FFFD, as for text output. A
+                # message may end partway through a multibyte sequence, in
+                # which case the decoder holds on to the start of the sequence
+                # until the next message from the same process.
+                if decoder is None:
+                    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+                    self._decoders[message.name] = decoder
+                data = decoder.decode(data).encode('utf-8')
+                if not decoder.getstate()[0]:
+                    del self._decoders[message.name]
+
+        lines = data.splitlines()
+        if not lines:
+            return
+        prefix = self._prefix(message)[1]
+        self._emit(prefix + (b'\n' + prefix).join(lines) + b'\n')
+
+    def flush(self):
+        """
+        Write out any buffered lines. This is a no-op if the printer is not
+        buffered.
+        """
+        if not self._buffer:
+            return
+        # The buffer holds either text or bytes, never a mixture.
+        self._write(self._buffer[0][:0].join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        self._buffered_since = None
+
+    def _emit(self, data):
+        if self.buffer_size is None:
+            self._write(data)
+            return
+
+        if not self._buffer:
+            self._buffered_since = time.monotonic()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if (self._buffered >= self.buffer_size
+                or time.monotonic() - self._buffered_since >= self.flush_interval):
+            self.flush()
+
+    def _write(self, data):
+        out = self._binary_output if isinstance(data, bytes) else self.output
+        out.write(data)
+        out.flush()
+
+    def _prefix(self, message):
+        """Return the prefix for the given message, as text and as bytes."""
+        # The prefix for a given process only changes when the formatted time
+        # does, which for the default time format is once a second, so we
+        # cache the last prefix rendered for each process.
+        t = message.time
+        if self.elapsed:
+            if not isinstance(t, int):
+                t = clock.from_datetime(t)
+            when = (t - clock.START) // 1000000
+        elif isinstance(t, int):
+            unit = 1000 if '%f' in self.time_format else clock.NS_PER_SECOND
+            when = (t + clock.OFFSET) // unit
+        elif '%f' in self.time_format:
+            when = t
+        else:
+            when = t.replace(microsecond=0)
+        key = (message.name, message.colour)
+        stamp = (when, self.time_format, self.elapsed, self.width, self.colour)
+
+        cached = self._prefix_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1:]
+
+        name = message.name if message.name is not None else ""
+        name = name.ljust(self.width)
+        if name:
+            name += " "
+
+        if self.elapsed:
+            time_formatted = clock.elapsed(t)
+        elif isinstance(t, int):
+            time_formatted = clock.to_datetime(t).strftime(self.time_format)
+        else:
+            time_formatted = t.strftime(self.time_format)
+        prefix = '{time} {name}| '.format(time=time_formatted, name=name)
+        if self.colour and self._colours_supported and message.colour:
+            prefix = _colour_string(message.colour, prefix)
+
+        self._prefix_cache[key] = (stamp, prefix, prefix.encode(self._encoding))
+        return self._prefix_cache[key][1:]
+
+
+def _valid_utf8(data):
+    if data.isascii():
+        return True
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
 
 
 def _ansi(code):
     return '\033[{0}m'.format(code)
 
 
+_RESET = _ansi(0)
+
+
 def _colour_string(colour, s):
-    return '{0}{1}{2}{3}'.format(_ansi(0), _ansi(colour), s, _ansi(0))
+    return _RESET + _ansi(colour) + s + _RESET
 
 
 if ON_WINDOWS:
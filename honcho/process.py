@@ -1,11 +1,46 @@
-import datetime
 import os
+import re
+import selectors
+import shlex
 import signal
 import subprocess
+import time
 
+from . import clock
 from .compat import ON_WINDOWS
+from .environ import LayeredEnv
 from .printer import Message
 
+# The maximum number of bytes of output to read from a child at once.
+READ_SIZE = 65536
+
+# How long to continue reading a child's output after it has exited, in case
+# its output pipe is being held open by a longer-lived grandchild.
+DRAIN_WAIT = 0.5
+
+# The returncode reported for a process which couldn't be started at all, as
+# for a command which the shell couldn't find.
+SPAWN_FAILED = 127
+
+# Appended to lines which have been cut short for exceeding the maximum line
+# length.
+TRUNCATED_MARKER = b' [truncated]'
+
+# Characters which, outside of single quotes (or double quotes, for those not
+# special there), mean a command needs a shell to run it.
+SHELL_METACHARACTERS = frozenset('|&;<>()$`\\"\'*?[]{}~#!\n')
+
+# Shell builtins and keywords which might begin a command, and for which there
+# is no executable that would do the same thing.
+SHELL_BUILTINS = frozenset([
+    '.', ':', 'alias', 'bg', 'break', 'case', 'cd', 'command', 'continue',
+    'eval', 'exec', 'exit', 'export', 'fg', 'for', 'function', 'if', 'jobs',
+    'read', 'readonly', 'return', 'set', 'shift', 'source', 'time', 'trap',
+    'ulimit', 'umask', 'unalias', 'unset', 'until', 'wait', 'while',
+])
+
+_QUOTED = re.compile(r'\'[^\']*\'|"[^"$`\\]*"')
+
 
 class Process(object):
     """
@@ -19,23 +54,116 @@ class Process(object):
                  colour=None,
                  quiet=False,
                  env=None,
-                 cwd=None):
+                 cwd=None,
+                 max_line_length=None,
+                 truncate_lines=False,
+                 quiet_log=None,
+                 direct_exec=False):
         self.cmd = cmd
         self.colour = colour
         self.quiet = quiet
         self.name = name
-        self.env = os.environ.copy() if env is None else env
+        self.env = LayeredEnv({}, os.environ) if env is None else env
         self.cwd = cwd
+        self.max_line_length = max_line_length
+        self.truncate_lines = truncate_lines
+        self.quiet_log = quiet_log
+        self.direct_exec = direct_exec
 
-        self._clock = datetime.datetime
+        self._clock = clock.Clock
+        self._lines = LineBuffer(max_line_length, truncate_lines)
         self._child = None
         self._child_ctor = Popen
+        self._credits = None
 
-    def run(self, events=None, ignore_signals=False):
+    def spawn(self, events=None):
+        """
+        Start the child process and report its PID to the given queue, without
+        waiting for it to produce any output.
+        """
         self._events = events
-        self._child = self._child_ctor(self.cmd, env=self.env, cwd=self.cwd)
+        self._lines = LineBuffer(self.max_line_length, self.truncate_lines)
+        output = self._open_output() if self.quiet else subprocess.PIPE
+        try:
+            self._child = self._child_ctor(self.cmd,
+                                           env=dict(self.env),
+                                           cwd=self.cwd,
+                                           stdout=output,
+                                           direct_exec=self.direct_exec)
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+        self._pidfd = self._child.pidfd
         self._send_message({'pid': self._child.pid}, type='start')
 
+    def fileno(self):
+        """
+        Return the file descriptor from which the child's output is read, or
+        None if it isn't read at all (because the process is quiet).
+        """
+        if self._child.stdout is None:
+            return None
+        return self._child.stdout.fileno()
+
+    def exit_fileno(self):
+        """
+        Return a file descriptor which becomes readable when the child exits,
+        or None if this isn't supported on this platform (or the child has
+        already been reaped).
+        """
+        return self._pidfd
+
+    def read(self):
+        """
+        Read whatever output is currently available from the child (up to
+        READ_SIZE bytes) and forward any complete lines to the queue as a
+        single message. Returns False once the child's output
+        has been exhausted, at which point :func:`finish` should be called.
+
+        This is intended to be called when :func:`fileno` is readable, and so
+        will block for at most one read.
+        """
+        chunk = os.read(self.fileno(), READ_SIZE)
+        if not chunk:
+            return False
+
+        data = self._lines.feed(chunk)
+        if data and not self.quiet:
+            self._send_output(data)
+        return True
+
+    def poll(self):
+        """
+        Return the child's returncode if it has exited, or None if it is still
+        running, without blocking.
+        """
+        return self._child.poll()
+
+    def reap(self):
+        """
+        Reap the child. This is intended to be called when :func:`exit_fileno`
+        is readable, and so will not block.
+        """
+        self._child.wait()
+        self._close_pidfd()
+
+    def finish(self):
+        """
+        Forward any remaining output, reap the child if that hasn't already
+        been done, and send a 'stop' message.
+        """
+        data = self._lines.flush()
+        if data and not self.quiet:
+            self._send_output(data)
+        self._stop()
+
+    def run(self, events=None, ignore_signals=False, credits=None):
+        # If given a semaphore of credits, each message of output must acquire
+        # one before it is sent, so that a process can't get too far ahead of
+        # the printing of its output.
+        self._credits = credits
+        self.spawn(events)
+
         # Don't pay attention to SIGINT/SIGTERM. The process itself is
         # considered unkillable, and will only exit when its child (the shell
         # running the Procfile process) exits.
@@ -43,14 +171,66 @@ class Process(object):
             signal.signal(signal.SIGINT, signal.SIG_IGN)
             signal.signal(signal.SIGTERM, signal.SIG_IGN)
 
-        for line in iter(self._child.stdout.readline, b''):
-            if not self.quiet:
-                self._send_message(line)
-        self._child.stdout.close()
+        if self.fileno() is None:
+            self._child.wait()
+        elif self.exit_fileno() is not None:
+            self._run_until_exit()
+        else:
+            while self.read():
+                pass
+        self.finish()
+
+    def _run_until_exit(self):
+        # Wait for output or for the child to exit, whichever comes first. If
+        # the child exits we continue to read output for a little while, but
+        # don't wait for EOF: the pipe may have been inherited by a grandchild
+        # which is still running.
+        sel = selectors.DefaultSelector()
+        sel.register(self.fileno(), selectors.EVENT_READ, self.read)
+        sel.register(self.exit_fileno(), selectors.EVENT_READ)
+        drain_until = None
+        try:
+            while drain_until is None or time.monotonic() < drain_until:
+                timeout = None
+                if drain_until is not None:
+                    timeout = max(0, drain_until - time.monotonic())
+                for key, _ in sel.select(timeout):
+                    if key.data is not None:
+                        if not key.data():
+                            return
+                    else:
+                        sel.unregister(key.fd)
+                        self.reap()
+                        drain_until = time.monotonic() + DRAIN_WAIT
+        finally:
+            sel.close()
+
+    def _stop(self):
+        if self._child.stdout is not None:
+            self._child.stdout.close()
         self._child.wait()
+        self._close_pidfd()
 
         self._send_message({'returncode': self._child.returncode}, type='stop')
 
+    def _close_pidfd(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+            self._pidfd = None
+
+    def _open_output(self):
+        # A quiet process's output goes straight to its quiet_log (or nowhere)
+        # rather than passing through us.
+        if self.quiet_log is None:
+            return subprocess.DEVNULL
+        return open(self.quiet_log, 'ab')
+
+    def _send_output(self, data):
+        if self._credits is not None:
+            # While we wait, the child will block once its output pipe fills.
+            self._credits.acquire()
+        self._send_message(data)
+
     def _send_message(self, data, type='line'):
         if self._events is not None:
             self._events.put(Message(type=type,
@@ -60,10 +240,132 @@ class Process(object):
                                      colour=self.colour))
 
 
+class LineBuffer(object):
+    """
+    LineBuffer splits a stream of arbitrarily-sized chunks of output at line
+    boundaries. Each call to :func:`feed` returns all the complete lines
+    available so far as a single bytestring, holding back any trailing partial
+    line until a subsequent chunk completes it.
+
+    If `max_length` is given, lines longer than that many bytes are split into
+    lines of at most `max_length` bytes as they arrive or, if `truncate` is
+    set, cut short with TRUNCATED_MARKER and the rest of the line discarded.
+    Either way, no more than `max_length` bytes of a partial line are held.
+    """
+
+    def __init__(self, max_length=None, truncate=False):
+        if max_length is not None and max_length < 1:
+            raise ValueError("invalid max_length: %s" % max_length)
+        self.max_length = max_length
+        self.truncate = truncate
+        self._partial = []
+        self._partial_length = 0
+        self._discarding = False
+
+    def feed(self, chunk):
+        if self._discarding:
+            # Skip the remainder of a truncated line.
+            start = chunk.find(b'\n') + 1
+            if not start:
+                return b''
+            self._discarding = False
+            chunk = chunk[start:]
+
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            self._partial.append(chunk)
+            self._partial_length += len(chunk)
+            if self.max_length is not None and self._partial_length > self.max_length:
+                return self._limit_partial()
+            return b''
+
+        if self._partial:
+            self._partial.append(chunk[:end])
+            data = b''.join(self._partial)
+            self._partial = []
+        elif end == len(chunk):
+            data = chunk
+        else:
+            data = chunk[:end]
+
+        self._partial_length = len(chunk) - end
+        if self._partial_length:
+            self._partial.append(chunk[end:])
+
+        if self.max_length is not None:
+            if len(data) > self.max_length:
+                data = self._limit(data)
+            if self._partial_length > self.max_length:
+                data += self._limit_partial()
+        return data
+
+    def flush(self):
+        """Return any buffered partial line."""
+        data = b''.join(self._partial)
+        self._partial = []
+        self._partial_length = 0
+        self._discarding = False
+        return data
+
+    def _limit(self, data):
+        # Split or truncate any overlong lines in a run of complete lines.
+        lines = data.split(b'\n')
+        if max(map(len, lines)) <= self.max_length:
+            return data
+        return b''.join(self._limit_line(line) for line in lines[:-1])
+
+    def _limit_line(self, line):
+        n = self.max_length
+        if len(line) <= n:
+            return line + b'\n'
+        if self.truncate:
+            return line[:n] + TRUNCATED_MARKER + b'\n'
+        return b''.join(line[i:i + n] + b'\n' for i in range(0, len(line), n))
+
+    def _limit_partial(self):
+        # Split or truncate an overlong partial line, holding back at most
+        # max_length bytes of it.
+        line = b''.join(self._partial)
+        n = self.max_length
+        if self.truncate:
+            self._partial = []
+            self._partial_length = 0
+            self._discarding = True
+            return line[:n] + TRUNCATED_MARKER + b'\n'
+
+        end = len(line) - (len(line) % n or n)
+        self._partial = [line[end:]]
+        self._partial_length = len(line) - end
+        return b''.join(line[i:i + n] + b'\n' for i in range(0, end, n))
+
+
+def split_command(cmd):
+    """
+    Split a command into a list of arguments which can be executed directly,
+    or return None if the command uses any shell syntax (such as pipes,
+    redirection, variables, globs, or environment variable assignments) or
+    begins with a shell builtin.
+    """
+    if any(c in SHELL_METACHARACTERS for c in _QUOTED.sub('', cmd)):
+        return None
+    argv = shlex.split(cmd)
+    if not argv or '=' in argv[0] or argv[0] in SHELL_BUILTINS:
+        return None
+    return argv
+
+
 class Popen(subprocess.Popen):
+    """
+    Run a command with the shell, with its output piped back to us.
+
+    If `direct_exec` is set and the command needs no shell (see
+    :func:`split_command`), it is run directly instead, saving a process and
+    making its PID that of the command itself. This isn't done on Windows.
+    """
 
     def __init__(self, cmd, **kwargs):
         start_new_session = kwargs.pop('start_new_session', True)
+        direct_exec = kwargs.pop('direct_exec', False)
         options = {
             'stdout': subprocess.PIPE,
             'stderr': subprocess.STDOUT,
@@ -72,6 +374,8 @@ class Popen(subprocess.Popen):
         }
         options.update(**kwargs)
 
+        argv = split_command(cmd) if direct_exec and not ON_WINDOWS else None
+
         if ON_WINDOWS:
             # MSDN reference:
             #   http://msdn.microsoft.com/en-us/library/windows/desktop/ms684863%28v=vs.85%29.aspx
@@ -80,4 +384,21 @@ class Popen(subprocess.Popen):
         elif start_new_session:
             options.update(start_new_session=True)
 
-        super(Popen, self).__init__(cmd, **options)
+        if argv is not None:
+            try:
+                super(Popen, self).__init__(argv, **dict(options, shell=False))
+            except OSError:
+                # Leave the shell to report a command which can't be run, and
+                # exit with the usual status, as it would without direct_exec.
+                argv = None
+        if argv is None:
+            super(Popen, self).__init__(cmd, **options)
+
+        # Where the platform supports it, obtain a file descriptor referring to
+        # the child which becomes readable when it exits.
+        self.pidfd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                self.pidfd = os.pidfd_open(self.pid)
+            except OSError:
+                pass
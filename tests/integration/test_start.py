@@ -59,3 +59,58 @@ def test_start_returncode(testenv):
     ret, out, err = testenv.run_honcho(['start'])
 
     assert ret == 42
+
+
+@pytest.mark.parametrize('testenv', [{
+    'Procfile': 'foo: {0} test.py'.format(python_bin),
+    'test.py': 'for i in range(1000): print(i)',
+}], indirect=True)
+def test_start_rate_limit(testenv):
+    ret, out, err = testenv.run_honcho(['start', '--rate-limit', 'foo=10/s'])
+
+    assert ret == 0
+    assert 'foo.1: 990 lines suppressed' in out
+
+
+@pytest.mark.parametrize('testenv', [{
+    'Procfile': 'foo: {0} test.py'.format(python_bin),
+    'test.py': textwrap.dedent("""
+        import time
+        for i in range(30):
+            print(i, flush=True)
+            time.sleep(0.02)
+        """),
+}], indirect=True)
+def test_start_rate_limit_with_backlog(testenv):
+    # Suppressed output mustn't use up the process's backlog.
+    result = testenv.run(['honcho', 'start', '--backlog', '2',
+                          '--rate-limit', 'foo=1/s'], timeout=30)
+
+    assert result.returncode == 0
+    assert 'lines suppressed' in result.stdout
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="requires select() on pipes")
+@pytest.mark.parametrize('testenv', [{
+    'Procfile': 'foo: {0} test.py'.format(python_bin),
+    'test.py': script,
+}], indirect=True)
+def test_start_select_engine(testenv):
+    ret, out, err = testenv.run_honcho(['start', '--engine', 'select'])
+
+    assert ret == 0
+    assert 'elephant' in out
+    assert 'error output' in out
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="direct exec is POSIX only")
+@pytest.mark.parametrize('engine', ['fork', 'select'])
+@pytest.mark.parametrize('testenv', [{
+    'Procfile': 'foo: honcho-no-such-command --flag',
+}], indirect=True)
+def test_start_direct_exec_missing_command(testenv, engine):
+    result = testenv.run(['honcho', 'start', '--direct-exec', '--engine', engine],
+                         timeout=30)
+
+    assert result.returncode == 127
+    assert 'foo.1 stopped (rc=127)' in result.stdout
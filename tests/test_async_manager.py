@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from honcho import async_manager
+from honcho.async_manager import AsyncManager
+from honcho.compat import ON_WINDOWS
+from honcho.manager import SYSTEM_PRINTER_NAME
+
+pytestmark = pytest.mark.skipif(ON_WINDOWS, reason="uses POSIX shell commands")
+
+
+class FakePrinter(object):
+
+    def __init__(self, width=0):
+        self.width = width
+        self.lines = []
+
+    def write(self, message):
+        self.lines.append(message)
+
+    def got_line(self, data):
+        return self.find_line(data) is not None
+
+    def find_line(self, data):
+        for line in self.lines:
+            if line.data == data:
+                return line
+        return None
+
+    def output(self, name):
+        return b''.join(line.data for line in self.lines if line.name == name)
+
+
+class TestAsyncManager(object):
+    @pytest.fixture(autouse=True)
+    def printer(self):
+        self.p = FakePrinter()
+        self.m = AsyncManager(printer=self.p)
+
+    def test_init_sets_default_printer_width(self):
+        assert self.p.width == len(SYSTEM_PRINTER_NAME)
+
+    def test_add_process_updates_printer_width(self):
+        self.m.add_process('interesting', 'ruby server.rb')
+        assert self.p.width == len('interesting')
+
+    def test_loop_with_empty_manager_returns_immediately(self):
+        asyncio.run(self.m.loop())
+
+    def test_loop_prints_lines(self):
+        self.m.add_process('foo', 'printf "one\\ntwo\\n"')
+        asyncio.run(self.m.loop())
+        assert self.p.output('foo') == b'one\ntwo\n'
+        assert self.p.got_line('foo stopped (rc=0)\n')
+
+    def test_quiet_process(self):
+        self.m.add_process('foo', 'echo hello', quiet=True)
+        start = time.monotonic()
+        asyncio.run(self.m.loop())
+        assert time.monotonic() - start < 0.5
+        assert self.p.output('foo') == b''
+        assert self.p.got_line('foo stopped (rc=0)\n')
+
+    def test_spawn_failure_stops_process(self):
+        self.m.add_process('foo', 'echo hello', cwd='/nonexistent')
+        self.m.add_process('bar', 'sleep 10')
+        start = time.monotonic()
+        asyncio.run(asyncio.wait_for(self.m.loop(), 8))
+        assert time.monotonic() - start < 5
+        assert self.m.returncode == 127
+        assert self.p.got_line('foo stopped (rc=127)\n')
+        assert self.p.find_line(b'hello\n') is None
+
+    def test_direct_exec_missing_command(self):
+        self.m.add_process('foo', 'honcho-no-such-command', direct_exec=True)
+        asyncio.run(asyncio.wait_for(self.m.loop(), 8))
+        assert self.m.returncode == 127
+        assert b'honcho-no-such-command' in self.p.output('foo')
+
+    def test_events_in_order(self):
+        self.m.add_process('foo', 'echo hello')
+
+        async def _collect():
+            return [msg async for msg in self.m.events()]
+
+        events = asyncio.run(_collect())
+        assert [e.type for e in events] == ['start', 'line', 'stop']
+        assert events[1].data == b'hello\n'
+
+    def test_returncode_set_by_first_exiting_process(self):
+        self.m.add_process('foo', 'exit 42')
+        self.m.add_process('bar', 'sleep 10')
+        asyncio.run(self.m.loop())
+        assert self.m.returncode == 42
+        assert self.p.got_line('bar stopped (rc=-15)\n')
+
+    def test_terminate(self):
+        self.m.add_process('foo', 'sleep 10')
+
+        async def _run():
+            loop = asyncio.ensure_future(self.m.loop())
+            await asyncio.sleep(0.2)
+            await self.m.terminate()
+            await loop
+
+        asyncio.run(_run())
+        assert self.m.returncode == -15
+
+    def test_terminate_kills_process_ignoring_sigterm(self, monkeypatch):
+        monkeypatch.setattr(async_manager, 'KILL_WAIT', 1)
+        self.m.add_process('foo', "trap '' TERM; sleep 30")
+
+        async def _run():
+            loop = asyncio.ensure_future(self.m.loop())
+            await asyncio.sleep(0.2)
+            await self.m.terminate()
+            await asyncio.wait_for(loop, 5)
+
+        asyncio.run(_run())
+        assert self.m._processes['foo'].process.get_returncode() == -9
+        assert self.p.got_line('foo stopped (rc=-9)\n')
+
+    def test_managers_share_event_loop(self):
+        other = AsyncManager(printer=FakePrinter())
+        self.m.add_process('foo', 'echo one')
+        other.add_process('bar', 'echo two')
+
+        async def _run():
+            await asyncio.gather(self.m.loop(), other.loop())
+
+        asyncio.run(_run())
+        assert self.p.got_line(b'one\n')
+        assert other._printer.got_line(b'two\n')
+
+    def test_stop_not_delayed_by_inherited_output(self):
+        self.m.add_process('foo', 'sleep 10 & echo hello')
+        start = time.monotonic()
+        asyncio.run(self.m.loop())
+        assert time.monotonic() - start < 5
+        assert self.p.got_line(b'hello\n')
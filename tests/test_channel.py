@@ -0,0 +1,73 @@
+import multiprocessing
+import queue
+import threading
+
+import pytest
+
+from honcho.channel import Channel
+from honcho.printer import Message
+
+TIME = 1234567890
+
+
+def _send(channel, messages):
+    for msg in messages:
+        channel.put(msg)
+
+
+def _message(type, data, name='foo'):
+    return Message(type=type, data=data, time=TIME, name=name, colour=None)
+
+
+class TestChannel(object):
+
+    @pytest.fixture(autouse=True)
+    def channel(self):
+        self.c = Channel()
+        self.c.register('foo', '31')
+        self.c.register('bar')
+
+    def _send_from_child(self, messages):
+        child = multiprocessing.Process(target=_send, args=(self.c, messages))
+        child.start()
+        received = [self.c.get(timeout=5) for _ in messages]
+        child.join()
+        return received
+
+    def test_events_from_child(self):
+        received = self._send_from_child([
+            _message('start', {'pid': 123}),
+            _message('line', b'hello\n'),
+            _message('line', b'world\n', name='bar'),
+            _message('stop', {'returncode': -15}),
+        ])
+        assert received == [
+            Message('start', {'pid': 123}, TIME, 'foo', '31'),
+            Message('line', b'hello\n', TIME, 'foo', '31'),
+            Message('line', b'world\n', TIME, 'bar', None),
+            Message('stop', {'returncode': -15}, TIME, 'foo', '31'),
+        ]
+
+    def test_large_output_from_child(self):
+        data = b'x' * 1000000 + b'\n'
+        received = self._send_from_child([_message('line', data)])
+        assert received[0].data == data
+
+    def test_local_events_passed_unchanged(self):
+        msg = Message(type='signal', data={'signum': 15}, time=TIME,
+                      name=None, colour=None)
+        self.c.put(msg)
+        assert self.c.get(timeout=0) is msg
+
+    def test_get_times_out(self):
+        with pytest.raises(queue.Empty):
+            self.c.get(timeout=0.01)
+
+    def test_local_event_wakes_get(self):
+        msg = _message('line', b'hello\n')
+        timer = threading.Timer(0.1, self.c.put, (msg,))
+        timer.start()
+        try:
+            assert self.c.get(timeout=5) is msg
+        finally:
+            timer.cancel()
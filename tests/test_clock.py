@@ -0,0 +1,25 @@
+import datetime
+
+from honcho import clock
+
+
+def test_now_is_monotonic():
+    t1 = clock.now()
+    t2 = clock.now()
+    assert t2 >= t1
+
+
+def test_datetime_round_trip():
+    dt = datetime.datetime(2012, 8, 11, 12, 42, 0, 500000)
+    assert clock.to_datetime(clock.from_datetime(dt)) == dt
+
+
+def test_start_is_now():
+    assert abs(clock.to_datetime(clock.START) - datetime.datetime.now()) < \
+        datetime.timedelta(minutes=5)
+
+
+def test_elapsed():
+    assert clock.elapsed(clock.START) == '+0.000s'
+    assert clock.elapsed(clock.START + 12345678901) == '+12.345s'
+    assert clock.elapsed(clock.START + 3600 * clock.NS_PER_SECOND) == '+3600.000s'
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+
 import pytest
 
 from honcho import command
@@ -88,3 +92,128 @@ def test_procfile_precedence(monkeypatch):
     args = command.parser.parse_args(['start', '-f', 'Procfile.cli'])
     result = command.map_from(args)['procfile']
     assert result == 'Procfile.cli'
+
+
+@pytest.mark.parametrize('argv', [
+    ['start', '--backlog', '0'],
+    ['start', '--backlog', '-1'],
+    ['start', '--max-line-length', '0'],
+])
+def test_invalid_arguments(argv):
+    with pytest.raises(SystemExit):
+        command.parser.parse_args(argv)
+
+
+@pytest.mark.parametrize('desc', [
+    'foo=inf', 'foo=nan', 'foo=-5/s', 'foo=0', 'foo', 'foo=fast',
+])
+def test_parse_rate_limit_invalid(desc):
+    with pytest.raises(command.CommandError):
+        command._parse_rate_limit(desc)
+
+
+def test_parse_rate_limit():
+    assert command._parse_rate_limit('foo=10/s,bar=0.5') == {'foo': 10.0,
+                                                             'bar': 0.5}
+
+
+def test_export_choices():
+    assert 'supervisord' in command.export_choices
+    assert list(command.export_choices) == sorted(command.export_choices)
+
+
+def test_import_is_lazy():
+    # Importing honcho.command shouldn't pay for anything only needed by
+    # particular commands.
+    code = ('import sys, honcho.command; '
+            'print(" ".join(m for m in ("multiprocessing", "honcho.manager", '
+            '"honcho.printer") if m in sys.modules))')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == b''
+
+
+class TestReadEnv(object):
+
+    @pytest.fixture(autouse=True)
+    def env_files(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(command, '_env_cache', {})
+        monkeypatch.delenv('HONCHO_ENV_CACHE', raising=False)
+        (tmp_path / '.env').write_text('ANIMAL=giraffe\n')
+        (tmp_path / '.env.local').write_text('ANIMAL=elephant\nPLANT=fern\n')
+        self.root = str(tmp_path)
+        self.parsed = []
+
+        def _parse(content):
+            self.parsed.append(content)
+            return self._parse(content)
+
+        self._parse = command.environ.parse
+        monkeypatch.setattr(command.environ, 'parse', _parse)
+
+    def test_later_files_take_precedence(self):
+        assert command._read_env(self.root, '.env, .env.local') == {
+            'ANIMAL': 'elephant',
+            'PLANT': 'fern',
+        }
+
+    def test_missing_files_ignored(self):
+        assert command._read_env(self.root, '.env,.env.missing') == {'ANIMAL': 'giraffe'}
+
+    def test_parsed_once(self):
+        command._read_env(self.root, '.env')
+        command._read_env(self.root, '.env')
+        assert len(self.parsed) == 1
+
+    def test_result_not_shared(self):
+        command._read_env(self.root, '.env')['ANIMAL'] = 'aardvark'
+        assert command._read_env(self.root, '.env') == {'ANIMAL': 'giraffe'}
+
+    def test_parsed_again_when_changed(self):
+        command._read_env(self.root, '.env')
+        with open(os.path.join(self.root, '.env'), 'w') as f:
+            f.write('ANIMAL=mongoose\n')
+        assert command._read_env(self.root, '.env') == {'ANIMAL': 'mongoose'}
+        assert len(self.parsed) == 2
+
+    def test_disk_cache(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('HONCHO_ENV_CACHE', str(tmp_path / 'cache'))
+        command._read_env(self.root, '.env')
+        monkeypatch.setattr(command, '_env_cache', {})
+        assert command._read_env(self.root, '.env') == {'ANIMAL': 'giraffe'}
+        assert len(self.parsed) == 1
+
+    @pytest.mark.skipif(not hasattr(os, 'getuid'), reason="uses POSIX permissions")
+    def test_disk_cache_private(self, monkeypatch, tmp_path):
+        cache = tmp_path / 'cache'
+        monkeypatch.setenv('HONCHO_ENV_CACHE', str(cache))
+        command._read_env(self.root, '.env')
+        assert cache.stat().st_mode & 0o777 == 0o700
+        [entry] = cache.iterdir()
+        assert entry.stat().st_mode & 0o777 == 0o600
+
+    @pytest.mark.skipif(not hasattr(os, 'getuid'), reason="uses POSIX permissions")
+    def test_disk_cache_not_used_when_writable_by_others(self, monkeypatch, tmp_path):
+        cache = tmp_path / 'cache'
+        cache.mkdir()
+        cache.chmod(0o777)
+        monkeypatch.setenv('HONCHO_ENV_CACHE', str(cache))
+        command._read_env(self.root, '.env')
+        assert list(cache.iterdir()) == []
+
+    @pytest.mark.skipif(not hasattr(os, 'getuid'), reason="uses POSIX permissions")
+    def test_disk_cache_not_used_when_owned_by_others(self, monkeypatch, tmp_path):
+        cache = tmp_path / 'cache'
+        monkeypatch.setenv('HONCHO_ENV_CACHE', str(cache))
+        command._read_env(self.root, '.env')
+        monkeypatch.setattr(command, '_env_cache', {})
+        monkeypatch.setattr(os, 'getuid', lambda: cache.stat().st_uid + 1)
+        assert command._read_env(self.root, '.env') == {'ANIMAL': 'giraffe'}
+        assert len(self.parsed) == 2
+
+    def test_disk_cache_versioned(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('HONCHO_ENV_CACHE', str(tmp_path / 'cache'))
+        command._read_env(self.root, '.env')
+        monkeypatch.setattr(command, '_env_cache', {})
+        monkeypatch.setattr(command, 'ENV_CACHE_VERSION', command.ENV_CACHE_VERSION + 1)
+        assert command._read_env(self.root, '.env') == {'ANIMAL': 'giraffe'}
+        assert len(self.parsed) == 2
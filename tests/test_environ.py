@@ -1,11 +1,14 @@
 # coding=utf-8
 
 import collections
+import os
+import pickle
 import textwrap
 
 import pytest
 
 from honcho import environ
+from honcho.ports import PortAllocator
 
 
 @pytest.mark.parametrize('content,commands', [
@@ -116,6 +119,54 @@ from honcho import environ
          'NEWLINES': 'foo\nbar',
          'DOLLAR': 'foo\\$bar'}
     ],
+    [
+        # Trailing comments
+        r"""
+        FOO=bar # comment
+        BAR="baz"#comment
+        BAZ='#not a comment'
+        """,
+        {'FOO': 'bar', 'BAR': 'baz', 'BAZ': '#not a comment'}
+    ],
+    [
+        # Whitespace around the assignment
+        r"""
+          FOO = bar
+        """,
+        {'FOO': 'bar'}
+    ],
+    [
+        # Empty values
+        r"""
+        FOO=
+        BAR=''
+        BAZ=""
+        """,
+        {'BAR': '', 'BAZ': ''}
+    ],
+    [
+        # Unquoted whitespace in value
+        r"""
+        MYVAR=sp ace
+        """,
+        {'MYVAR': 'space'}
+    ],
+    [
+        # Quotes and escapes within a value
+        r"""
+        MIXED=un"quo ted"' 'val\ ue
+        ESCAPES="a\"b\\c\d"
+        """,
+        {'MIXED': 'unquo ted val ue',
+         'ESCAPES': 'a"b\\c\\d'}
+    ],
+    [
+        # Not an assignment
+        r"""
+        export FOO=bar
+        """,
+        {}
+    ],
 ])
 def test_environ_parse(content, commands):
     content = textwrap.dedent(content)
@@ -123,6 +174,16 @@ def test_environ_parse(content, commands):
     assert result == commands
 
 
+@pytest.mark.parametrize('content', [
+    "FOO='bar",
+    'FOO="bar',
+    'FOO=bar\\',
+])
+def test_environ_parse_invalid(content):
+    with pytest.raises(ValueError):
+        environ.parse(content)
+
+
 @pytest.mark.parametrize('content,processes', [
     [
         # Simple
@@ -299,6 +360,27 @@ def test_expand_processes_port_concurrency():
     assert p[4].env["PORT"] == "4101"
 
 
+def test_expand_processes_port_concurrency_beyond_stride():
+    p = ep(("foo", "some command"),
+           ("bar", "another command"),
+           concurrency={"foo": 150},
+           port=5000)
+    ports = [int(x.env["PORT"]) for x in p]
+    assert len(set(ports)) == 151
+    assert ports[149] == 5149
+    assert ports[150] == 5200
+    assert p.ports == [("foo", range(5000, 5150)), ("bar", range(5200, 5201))]
+
+
+def test_expand_processes_port_allocator():
+    p = ep(("foo", "some command"),
+           ("bar", "another command"),
+           concurrency={"foo": 2},
+           port=5000,
+           allocator=PortAllocator('pack'))
+    assert [x.env["PORT"] for x in p] == ["5000", "5001", "5002"]
+
+
 def test_expand_processes_quiet():
     p = ep(("foo", "some command"), quiet=["foo", "bar"])
     assert p[0].quiet
@@ -329,6 +411,43 @@ def test_expand_processes_env_multiple():
     assert p[1].env["DEBUG"] == "false"
 
 
+def test_expand_processes_env_shared():
+    env = {"ANIMAL": "giraffe"}
+    first, second = ep(("foo", "some command"), concurrency={"foo": 2},
+                       env=env, port=5000)
+    first.env["ANIMAL"] = "elephant"
+    assert first.env["ANIMAL"] == "elephant"
+    assert second.env["ANIMAL"] == "giraffe"
+    assert env == {"ANIMAL": "giraffe"}
+    assert first.env.maps[1] is second.env.maps[1]
+
+
+def test_expand_processes_sequence():
+    p = ep(("foo", "some command"), ("bar", "another command"),
+           concurrency={"foo": 2, "bar": 3})
+    names = ["foo.1", "foo.2", "bar.1", "bar.2", "bar.3"]
+    assert [x.name for x in p] == names
+    assert [p[i].name for i in range(len(p))] == names
+    assert p[-1].name == "bar.3"
+    assert [x.name for x in p[1:4]] == names[1:4]
+    assert p == list(p)
+    with pytest.raises(IndexError):
+        p[5]
+
+
+def test_expand_processes_zero_concurrency():
+    p = ep(("foo", "some command"), ("bar", "another command"),
+           concurrency={"foo": 0})
+    assert [x.name for x in p] == ["bar.1"]
+
+
+def test_expand_processes_env_order():
+    p = ep(("foo", "some command"), env={"ANIMAL": "giraffe"}, port=5000)
+    assert list(p[0].env.items()) == [("HONCHO_PROCESS_NAME", "foo.1"),
+                                      ("ANIMAL", "giraffe"),
+                                      ("PORT", "5000")]
+
+
 def test_set_env_process_name():
     p = ep(("foo", "some command"),
            ("bar", "another command"),
@@ -338,3 +457,26 @@ def test_set_env_process_name():
     assert p[2].env["HONCHO_PROCESS_NAME"] == "foo.3"
     assert p[3].env["HONCHO_PROCESS_NAME"] == "bar.1"
     assert p[4].env["HONCHO_PROCESS_NAME"] == "bar.2"
+
+
+class TestLayeredEnv(object):
+    def test_lookup(self):
+        env = environ.LayeredEnv({'ANIMAL': 'giraffe'},
+                                 {'ANIMAL': 'elephant', 'PLANT': 'fern'})
+        assert env['ANIMAL'] == 'giraffe'
+        assert env['PLANT'] == 'fern'
+        assert dict(env) == {'ANIMAL': 'giraffe', 'PLANT': 'fern'}
+
+    def test_changes_only_first_layer(self):
+        base = {'ANIMAL': 'elephant'}
+        env = environ.LayeredEnv({}, base)
+        env['ANIMAL'] = 'giraffe'
+        env['PLANT'] = 'fern'
+        assert env == {'ANIMAL': 'giraffe', 'PLANT': 'fern'}
+        assert base == {'ANIMAL': 'elephant'}
+
+    def test_pickles_as_dict(self):
+        env = environ.LayeredEnv({'ANIMAL': 'giraffe'}, os.environ)
+        result = pickle.loads(pickle.dumps(env))
+        assert type(result) is dict
+        assert result == dict(env)
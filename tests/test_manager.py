@@ -1,11 +1,17 @@
 import datetime
-import multiprocessing
-import queue
+import io
+import os
+import signal
+import threading
+import time
 
 import pytest
 
-from honcho.manager import SYSTEM_PRINTER_NAME, Manager
-from honcho.printer import Message
+from honcho import manager
+from honcho.compat import ON_WINDOWS
+from honcho.manager import SYSTEM_PRINTER_NAME, Manager, SelectorManager
+from honcho.printer import Message, Printer
+from honcho.process import Process
 
 HISTORIES = {
     'one': {
@@ -41,13 +47,52 @@ HISTORIES = {
                      ('bar', 'line', b'butchers\n'),
                      ('bar', 'stop', {'returncode': -15})),
     },
+    'signal': {
+        'processes': {'foo': {}},
+        'messages': (('foo', 'start', {'pid': 123}),
+                     (None, 'signal', {'signum': signal.SIGTERM}),
+                     ('foo', 'stop', {'returncode': -15})),
+    },
+    'chatty': {
+        'processes': {'foo': {}, 'bar': {}, 'baz': {}},
+        'messages': (('foo', 'start', {'pid': 123}),
+                     ('bar', 'start', {'pid': 124}),
+                     ('baz', 'start', {'pid': 125}),
+                     ('foo', 'line', b'foo 1\n'),
+                     ('foo', 'line', b'foo 2\n'),
+                     ('foo', 'line', b'foo 3\n'),
+                     ('foo', 'line', b'foo 4\n'),
+                     ('bar', 'line', b'bar 1\n'),
+                     ('baz', 'stop', {'returncode': 1}),
+                     ('bar', 'line', b'bar 2\n'),
+                     ('bar', 'stop', {'returncode': -15}),
+                     ('foo', 'stop', {'returncode': -15})),
+    },
+    'flood_rate_limited': {
+        'processes': {'foo': {'rate_limit': 3}},
+        'messages': (('foo', 'start', {'pid': 123}),
+                     ('foo', 'line', b'one\n'),
+                     ('foo', 'line', b'two\n'),
+                     ('foo', 'line', b'three\nfour\n'),
+                     ('foo', 'line', b'five\n'),
+                     ('foo', 'stop', {'returncode': 0})),
+    },
+    'flood': {
+        'processes': {'foo': {}},
+        'messages': (('foo', 'start', {'pid': 123}),
+                     ('foo', 'line', b'one\n'),
+                     ('foo', 'line', b'two\n'),
+                     ('foo', 'line', b'three\nfour\n'),
+                     ('foo', 'line', b'five\n'),
+                     ('foo', 'stop', {'returncode': 0})),
+    },
 }
 
 
 class FakeClock(object):
 
     def now(self):
-        return datetime.datetime(2012, 8, 11, 12, 42)
+        return 1234567890
 
 
 class FakeProcessManager(object):
@@ -61,7 +106,9 @@ class FakeProcessManager(object):
 
 class FakeProcess(object):
 
-    def __init__(self, cmd, name=None, colour=None, quiet=None, env=None, cwd=None):
+    def __init__(self, cmd, name=None, colour=None, quiet=None, env=None, cwd=None,
+                 max_line_length=None, truncate_lines=False, quiet_log=None,
+                 direct_exec=False):
         self.cmd = cmd
         self.name = name
         self.colour = colour
@@ -69,7 +116,7 @@ class FakeProcess(object):
         self.env = env
         self.cwd = cwd
 
-    def run(self, events=None, ignore_signals=False):
+    def run(self, events=None, ignore_signals=False, credits=None):
         pass
 
 
@@ -86,7 +133,8 @@ class Harness(object):
         for name, options in self.history['processes'].items():
             self.manager.add_process(name,
                                      options.get('command', 'test'),
-                                     options.get('quiet', False))
+                                     options.get('quiet', False),
+                                     rate_limit=options.get('rate_limit'))
 
         def _loop(rc):
             self.manager.loop()
@@ -103,38 +151,33 @@ class Harness(object):
         self.manager.loop()
 
 
+class FakeOutput(io.StringIO):
+
+    def isatty(self):
+        return False
+
+
 class FakePrinter(object):
 
     def __init__(self, width=0):
         self.width = width
         self.lines_local = []
 
-        self._q = multiprocessing.Queue()
-
     def write(self, message):
-        # Called in a remote thread, so just put the message on the queue.
-        self._q.put(message)
-
-    def fetch_lines(self):
-        """
-        Retrieve any pending lines from the queue and put them on the local
-        line cache
-        """
-        while 1:
-            try:
-                self.lines_local.append(self._q.get(False))
-            except queue.Empty:
-                break
+        self.lines_local.append(message)
 
     def got_line(self, data):
         return self.find_line(data) is not None
 
     def find_line(self, data):
-        self.fetch_lines()
         for line in self.lines_local:
             if line.data == data:
                 return line
 
+    def output(self, name):
+        return b''.join(line.data for line in self.lines_local
+                        if line.name == name)
+
 
 class TestManager(object):
     @pytest.fixture(autouse=True)
@@ -190,10 +233,10 @@ class TestManager(object):
 
     def test_printer_receives_messages_in_correct_order(self):
         self.run_history('one')
-        self.p.fetch_lines()
         assert self.p.lines_local[0].data == 'foo started (pid=123)\n'
-        assert self.p.lines_local[1].data == b'hello, world!\n'
-        assert self.p.lines_local[2].data == 'foo stopped (rc=0)\n'
+        assert self.p.lines_local[1].data.startswith('all processes started in ')
+        assert self.p.lines_local[2].data == b'hello, world!\n'
+        assert self.p.lines_local[3].data == 'foo stopped (rc=0)\n'
 
     def test_printer_receives_lines_multi_process(self):
         self.run_history('two')
@@ -210,3 +253,205 @@ class TestManager(object):
         self.run_history('output_after_stop')
         assert self.p.got_line(b'fishmongers\n')
         assert self.p.got_line(b'butchers\n')
+
+    def test_buffered_printer_flushed(self):
+        out = FakeOutput()
+        self.m = Manager(printer=Printer(out, buffer_size=1024, flush_interval=60))
+        self.m._procmgr = FakeProcessManager()
+        self.run_history('one')
+        lines = [line.split(' ', 1)[1] for line in out.getvalue().splitlines()]
+        assert lines == [
+            'system | foo started (pid=123)',
+            'system | all processes started in %.3fs' % self.m.startup_time,
+            'foo    | hello, world!',
+            'system | foo stopped (rc=0)',
+        ]
+
+    def test_signal_terminates_processes(self):
+        self.run_history('signal')
+        assert self.p.got_line('SIGTERM received\n')
+        assert self.p.got_line('sending SIGTERM to foo (pid 123)\n')
+        assert self.h.manager.returncode == 143
+
+    def test_startup_time_recorded(self):
+        self.run_history('two')
+        assert self.m.startup_time >= 0
+        assert self.p.got_line('all processes started in %.3fs\n'
+                               % self.m.startup_time)
+
+    def test_output_interleaved_fairly(self):
+        self.run_history('chatty')
+        lines = [line.data for line in self.p.lines_local
+                 if line.name != SYSTEM_PRINTER_NAME]
+        assert lines == [b'foo 1\n', b'bar 1\n',
+                         b'foo 2\n', b'bar 2\n',
+                         b'foo 3\n', b'foo 4\n']
+
+    def test_stop_not_queued_behind_other_output(self):
+        self.run_history('chatty')
+        stopped = self.p.find_line('baz stopped (rc=1)\n')
+        assert self.p.lines_local.index(stopped) < self.p.lines_local.index(
+            self.p.find_line(b'foo 1\n'))
+
+    def test_stop_queued_behind_own_output(self):
+        self.run_history('chatty')
+        stopped = self.p.find_line('bar stopped (rc=-15)\n')
+        assert self.p.lines_local.index(stopped) > self.p.lines_local.index(
+            self.p.find_line(b'bar 2\n'))
+
+    def test_rate_limit_suppresses_lines(self):
+        self.run_history('flood_rate_limited')
+        assert self.p.output('foo') == b'one\ntwo\nthree\n'
+        assert self.p.got_line('foo: 2 lines suppressed in last 0s\n')
+        assert self.m.suppressed == {'foo': 2}
+
+    def test_unknown_overflow_policy(self):
+        with pytest.raises(ValueError):
+            Manager(overflow='explode')
+
+    @pytest.mark.parametrize('rate', [0, -5, float('inf'), float('nan')])
+    def test_invalid_rate_limit(self, rate):
+        with pytest.raises(ValueError):
+            self.m.add_process('foo', 'echo 123', rate_limit=rate)
+        assert 'foo' not in self.m._processes
+
+    def test_invalid_backlog(self):
+        with pytest.raises(ValueError):
+            Manager(backlog=0)
+
+    def test_backlog_drop_newest(self):
+        self.m = Manager(printer=self.p, backlog=2, overflow='drop-newest')
+        self.m._procmgr = FakeProcessManager()
+        self.run_history('flood')
+        assert self.p.output('foo') == b'one\ntwo\n'
+        assert self.p.got_line('foo: 3 lines dropped\n')
+
+    def test_backlog_drop_oldest(self):
+        self.m = Manager(printer=self.p, backlog=2, overflow='drop-oldest')
+        self.m._procmgr = FakeProcessManager()
+        self.run_history('flood')
+        assert self.p.output('foo') == b'three\nfour\nfive\n'
+        assert self.p.got_line('foo: 2 lines dropped\n')
+
+    def test_backlog_drop_reported_before_stop(self):
+        self.m = Manager(printer=self.p, backlog=2, overflow='drop-newest')
+        self.m._procmgr = FakeProcessManager()
+        self.run_history('flood')
+        system = [line.data for line in self.p.lines_local
+                  if line.name == SYSTEM_PRINTER_NAME]
+        assert system[-2:] == ['foo: 3 lines dropped\n', 'foo stopped (rc=0)\n']
+
+    def test_backlog_block_loses_nothing(self):
+        self.m = Manager(printer=self.p, backlog=2, overflow='block')
+        self.m._procmgr = FakeProcessManager()
+        self.run_history('flood')
+        assert self.p.output('foo') == b'one\ntwo\nthree\nfour\nfive\n'
+        assert not self.p.got_line('foo: 0 lines dropped\n')
+
+
+@pytest.mark.skipif(ON_WINDOWS, reason="requires select() on pipes")
+class TestSelectorManager(object):
+    @pytest.fixture(autouse=True)
+    def printer(self):
+        self.p = FakePrinter()
+        self.m = SelectorManager(printer=self.p)
+        self.m._clock = FakeClock()
+
+    def test_loop_with_empty_manager_returns_immediately(self):
+        self.m.loop()
+
+    def test_printer_receives_lines(self):
+        self.m.add_process('foo', 'printf "one\\ntwo\\n"')
+        self.m.loop()
+        assert self.p.output('foo') == b'one\ntwo\n'
+
+    def test_printer_receives_lines_multi_process(self):
+        self.m.add_process('foo', 'echo process one; sleep 0.5')
+        self.m.add_process('bar', 'echo process two; sleep 0.5')
+        self.m.loop()
+        l1 = self.p.find_line(b'process one\n')
+        l2 = self.p.find_line(b'process two\n')
+        assert l1.name == 'foo'
+        assert l2.name == 'bar'
+
+    def test_returncode_set_by_first_exiting_process(self):
+        self.m.add_process('foo', 'exit 42')
+        self.m.loop()
+        assert self.m.returncode == 42
+
+    def test_other_processes_terminated_on_exit(self):
+        self.m.add_process('foo', 'true')
+        self.m.add_process('bar', 'sleep 10')
+        self.m.loop()
+        assert self.p.got_line('sending SIGTERM to bar (pid %s)\n'
+                               % self.m._processes['bar'].pid)
+
+    def test_signal_wakes_loop(self):
+        self.m.add_process('foo', 'sleep 10')
+        timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+        timer.start()
+        try:
+            self.m.loop()
+        finally:
+            timer.cancel()
+        assert self.p.got_line('SIGTERM received\n')
+        assert self.m.returncode == 143
+
+    def test_quiet_process_output_not_read(self):
+        self.m.add_process('foo', 'echo hello', quiet=True)
+        self.m.add_process('bar', 'sleep 0.2')
+        self.m.loop()
+        assert self.p.output('foo') == b''
+        assert self.p.got_line('foo stopped (rc=0)\n')
+
+    def test_quiet_process_exit_polled(self, monkeypatch):
+        monkeypatch.setattr(Process, 'exit_fileno', lambda self: None)
+        self.m.add_process('foo', 'exit 3', quiet=True)
+        self.m.loop()
+        assert self.m.returncode == 3
+
+    def test_suppressed_output_reported_while_idle(self, monkeypatch):
+        monkeypatch.setattr(manager, 'SUPPRESS_REPORT_INTERVAL', 0.2)
+        self.m.add_process('foo', 'seq 1 100; sleep 10', rate_limit=10)
+        self.m.add_process('bar', 'sleep 1.5')
+        self.m.loop()
+        reports = [i for i, line in enumerate(self.p.lines_local)
+                   if line.name == SYSTEM_PRINTER_NAME
+                   and 'lines suppressed' in line.data]
+        assert reports
+        assert reports[0] < self.p.lines_local.index(
+            self.p.find_line('bar stopped (rc=0)\n'))
+
+    def test_backlog_block_loses_nothing(self):
+        self.m = SelectorManager(printer=self.p, backlog=1, overflow='block')
+        self.m.add_process('foo', 'seq 1 100000')
+        self.m.loop()
+        expected = ''.join('%d\n' % i for i in range(1, 100001)).encode()
+        assert self.p.output('foo') == expected
+
+    def test_closed_output_does_not_block_loop(self):
+        # foo closes its output but keeps running: bar exiting must still
+        # be noticed, and foo terminated, straight away.
+        self.m.add_process('foo', 'exec >/dev/null 2>&1; sleep 10')
+        self.m.add_process('bar', 'sleep 0.2; echo hello')
+        start = time.monotonic()
+        self.m.loop()
+        assert time.monotonic() - start < 5
+        assert self.p.output('bar') == b'hello\n'
+        assert self.p.got_line('sending SIGTERM to foo (pid %s)\n'
+                               % self.m._processes['foo'].pid)
+
+    def test_closed_output_exit_polled(self, monkeypatch):
+        monkeypatch.setattr(Process, 'exit_fileno', lambda self: None)
+        self.m.add_process('foo', 'exec >/dev/null 2>&1; sleep 0.2; exit 3')
+        self.m.loop()
+        assert self.m.returncode == 3
+
+    @pytest.mark.skipif(not hasattr(os, 'pidfd_open'), reason="requires pidfd")
+    def test_stop_not_delayed_by_inherited_output(self):
+        self.m.add_process('foo', 'sleep 10 & echo hello')
+        start = time.monotonic()
+        self.m.loop()
+        assert time.monotonic() - start < 5
+        assert self.p.output('foo') == b'hello\n'
+        assert self.p.got_line('foo stopped (rc=0)\n')
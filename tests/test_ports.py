@@ -0,0 +1,71 @@
+import socket
+
+import pytest
+
+from honcho.ports import PortAllocator, describe
+
+
+class TestPortAllocator(object):
+    def test_stride(self):
+        ports = PortAllocator().allocate(5000, [3, 2])
+        assert [list(p) for p in ports] == [[5000, 5001, 5002], [5100, 5101]]
+
+    def test_stride_custom(self):
+        ports = PortAllocator(stride=10).allocate(5000, [1, 1, 1])
+        assert [list(p) for p in ports] == [[5000], [5010], [5020]]
+
+    def test_stride_no_instances(self):
+        ports = PortAllocator().allocate(5000, [0, 1])
+        assert [list(p) for p in ports] == [[], [5100]]
+
+    def test_stride_beyond_stride(self):
+        ports = PortAllocator().allocate(5000, [150, 100, 1])
+        assert ports[0] == range(5000, 5150)
+        assert ports[1] == range(5200, 5300)
+        assert ports[2] == range(5300, 5301)
+
+    def test_pack(self):
+        ports = PortAllocator('pack').allocate(5000, [3, 2, 0, 1])
+        assert [list(p) for p in ports] == [[5000, 5001, 5002], [5003, 5004], [], [5005]]
+
+    def test_too_many_ports(self):
+        with pytest.raises(ValueError):
+            PortAllocator().allocate(65000, [100, 500, 100])
+
+    def test_invalid_strategy(self):
+        with pytest.raises(ValueError):
+            PortAllocator('scatter')
+
+    def test_invalid_stride(self):
+        with pytest.raises(ValueError):
+            PortAllocator(stride=0)
+
+    def test_probe_skips_ports_in_use(self):
+        allocator = PortAllocator(probe=True)
+        allocator.is_free = lambda port: port not in (5001, 5100)
+        ports = allocator.allocate(5000, [3, 2])
+        assert ports == [[5000, 5002, 5003], [5101, 5102]]
+
+    def test_probe_beyond_stride(self):
+        allocator = PortAllocator(stride=2, probe=True)
+        allocator.is_free = lambda port: port != 5001
+        ports = allocator.allocate(5000, [2, 1])
+        assert ports == [[5000, 5002], [5004]]
+
+    def test_is_free(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(('127.0.0.1', 0))
+            s.listen()
+            port = s.getsockname()[1]
+            assert not PortAllocator().is_free(port)
+
+
+@pytest.mark.parametrize('assignment,expected', [
+    [[('web', range(5000, 5150)), ('worker', range(5200, 5201))],
+     'web: 5000-5149; worker: 5200'],
+    [[('web', [5000, 5002, 5003]), ('worker', [])],
+     'web: 5000, 5002-5003'],
+    [[], ''],
+])
+def test_describe(assignment, expected):
+    assert describe(assignment) == expected
@@ -1,7 +1,9 @@
 import datetime
+import io
 
 import pytest
 
+from honcho import clock
 from honcho.printer import Message, Printer
 
 
@@ -33,6 +35,12 @@ class FakeOutput(object):
         return "".join(self.out)
 
 
+class FakeBinaryOutput(io.TextIOWrapper):
+
+    def __init__(self):
+        super(FakeBinaryOutput, self).__init__(io.BytesIO(), encoding='utf-8')
+
+
 class FakeTTY(FakeOutput):
 
     def isatty(self):
@@ -130,3 +138,121 @@ class TestPrinter(object):
         p = Printer(output=out, prefix=False)
         p.write(fake_message("paranoid android\n"))
         assert out.flushcount == 1
+
+    def test_write_prefix_follows_time(self):
+        out = FakeOutput()
+        p = Printer(output=out)
+        p.write(fake_message("one\n", name="foo"))
+        p.write(fake_message("two\n", name="foo",
+                             time=datetime.datetime(2012, 8, 11, 12, 42, 1)))
+        assert out.string() == "12:42:00 foo | one\n12:42:01 foo | two\n"
+
+    def test_write_prefix_follows_time_with_subsecond_format(self):
+        out = FakeOutput()
+        p = Printer(output=out, time_format="%S.%f")
+        p.write(fake_message("one\n"))
+        p.write(fake_message("two\n",
+                             time=datetime.datetime(2012, 8, 11, 12, 42, 0, 5)))
+        assert out.string() == "00.000000 | one\n00.000005 | two\n"
+
+    def test_write_clock_timestamp(self):
+        out = FakeOutput()
+        p = Printer(output=out)
+        t = clock.from_datetime(datetime.datetime(2012, 8, 11, 12, 42, 0, 999000))
+        p.write(fake_message("one\n", name="foo", time=t))
+        p.write(fake_message("two\n", name="foo", time=t + 2000000))
+        assert out.string() == "12:42:00 foo | one\n12:42:01 foo | two\n"
+
+    def test_write_elapsed(self):
+        out = FakeOutput()
+        p = Printer(output=out, elapsed=True)
+        p.write(fake_message("one\n", time=clock.START + 12345678901))
+        p.write(fake_message("two\n", time=clock.START + 12346000000))
+        assert out.string() == "+12.345s | one\n+12.346s | two\n"
+
+    def test_write_prefix_follows_width(self):
+        out = FakeOutput()
+        p = Printer(output=out)
+        p.write(fake_message("one\n", name="foo"))
+        p.width = 5
+        p.write(fake_message("two\n", name="foo"))
+        assert out.string() == "12:42:00 foo | one\n12:42:00 foo   | two\n"
+
+    def test_write_buffered(self):
+        out = FakeOutput()
+        p = Printer(output=out, buffer_size=1024, flush_interval=60)
+        p.write(fake_message("one\ntwo\n"))
+        assert out.string() == ""
+        p.flush()
+        assert out.string() == "12:42:00 | one\n12:42:00 | two\n"
+        assert out.flushcount == 1
+
+    def test_write_buffered_flushes_when_full(self):
+        out = FakeOutput()
+        p = Printer(output=out, prefix=False, buffer_size=8, flush_interval=60)
+        p.write(fake_message("one\n"))
+        assert out.string() == ""
+        p.write(fake_message("two\n"))
+        assert out.string() == "one\ntwo\n"
+
+    def test_write_buffered_flushes_after_interval(self):
+        out = FakeOutput()
+        p = Printer(output=out, prefix=False, buffer_size=1024, flush_interval=0)
+        p.write(fake_message("one\n"))
+        assert out.string() == "one\n"
+
+    def test_flush_unbuffered_is_noop(self):
+        out = FakeOutput()
+        p = Printer(output=out)
+        p.flush()
+        assert out.flushcount == 0
+
+    def test_write_without_prefix_binary_passthrough(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out, prefix=False)
+        p.write(fake_message(b"one\r\n\xfe\xff\n", name="foo"))
+        assert out.buffer.getvalue() == b"one\r\n\xfe\xff\n"
+
+    def test_write_without_prefix_binary_passthrough_no_newline(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out, prefix=False)
+        p.write(fake_message(b"monkeys", name="foo"))
+        p.write(fake_message("system message\n"))
+        assert out.buffer.getvalue() == b"monkeys\nsystem message\n"
+
+    def test_write_without_prefix_binary_passthrough_buffered(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out, prefix=False, buffer_size=1024, flush_interval=60)
+        p.write(fake_message(b"one\n"))
+        p.write(fake_message("two\n"))
+        assert out.buffer.getvalue() == b""
+        p.flush()
+        assert out.buffer.getvalue() == b"one\ntwo\n"
+
+    def test_write_binary(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out)
+        p.write(fake_message("café\n".encode('utf-8'), name="foo"))
+        p.write(fake_message("system message\n"))
+        assert out.buffer.getvalue() == ("12:42:00 foo | café\n"
+                                         "12:42:00 | system message\n").encode('utf-8')
+
+    def test_write_binary_invalid_utf8(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out)
+        p.write(fake_message(b"\xfe\xff\n"))
+        assert out.buffer.getvalue() == "12:42:00 | ��\n".encode('utf-8')
+
+    def test_write_binary_multibyte_split_across_messages(self):
+        out = FakeBinaryOutput()
+        p = Printer(output=out)
+        p.write(fake_message(b"caf\xc3"))
+        p.write(fake_message(b"\xa9\n"))
+        assert out.buffer.getvalue() == "12:42:00 | caf\n12:42:00 | é\n".encode('utf-8')
+
+    def test_write_binary_non_utf8_output_uses_text(self):
+        out = io.TextIOWrapper(io.BytesIO(), encoding='latin-1')
+        p = Printer(output=out)
+        p.write(fake_message("café\n".encode('utf-8')))
+        out.flush()
+        assert out.buffer.getvalue() == "12:42:00 | café\n".encode('latin-1')
@@ -1,14 +1,17 @@
-import datetime
+import os
+import subprocess
+import sys
+import time
 
 import pytest
 
-from honcho.process import Process
+from honcho.process import LineBuffer, Popen, Process, split_command
 
 
 class FakeClock(object):
 
     def now(self):
-        return datetime.datetime(2012, 8, 11, 12, 42)
+        return 1234567890
 
 
 class FakePopen(object):
@@ -18,6 +21,7 @@ class FakePopen(object):
         self.kwargs = kwargs
         self.stdout = FakeOutput()
         self.pid = 0x42
+        self.pidfd = None
         self.returncode = 0
 
     def wait(self):
@@ -54,6 +58,9 @@ class FakeQueue(object):
     def got_message(self, data):
         return self.find_message(data) is not None
 
+    def output(self):
+        return b''.join(msg.data for msg in self.messages if msg.type == 'line')
+
     def find_message(self, data):
         for msg in self.messages:
             if msg.data == data:
@@ -63,21 +70,22 @@ class FakeQueue(object):
 
 class FakeOutput(object):
     """
-    FakeOutput accepts a set of lines to emit in response to a call to
-    #readline(), after which it will emit b''.
+    FakeOutput is backed by a real pipe, into which the given lines (or chunks)
+    of data are written before the write end is closed, so that reads from it
+    will emit the data followed by EOF.
     """
 
     def __init__(self, lines=None):
-        self.lines = lines if lines is not None else []
+        self._r, w = os.pipe()
+        for line in lines or []:
+            os.write(w, line)
+        os.close(w)
 
-    def readline(self):
-        try:
-            return self.lines.pop(0)
-        except IndexError:
-            return b''
+    def fileno(self):
+        return self._r
 
     def close(self):
-        pass
+        os.close(self._r)
 
 
 class TestProcess(object):
@@ -123,7 +131,7 @@ class TestProcess(object):
         proc._child_ctor = FakePopen
         proc.run(self.q)
         msg = self.q.messages[0]
-        assert msg.time == datetime.datetime(2012, 8, 11, 12, 42)
+        assert msg.time == 1234567890
 
     def test_message_contains_colour(self):
         proc = Process('echo 123', colour="red")
@@ -141,8 +149,18 @@ class TestProcess(object):
         proc = Process('echo 123')
         proc._child_ctor = _ctor
         proc.run(self.q)
-        assert self.q.got_message(b"hello\n")
-        assert self.q.got_message(b"world\n")
+        assert self.q.output() == b"hello\nworld\n"
+
+    def test_output_receives_lines_in_batches(self):
+        def _ctor(*args, **kwargs):
+            popen = FakePopen(*args, **kwargs)
+            popen.stdout = FakeOutput(lines=[b"hello\n", b"world\n"])
+            return popen
+
+        proc = Process('echo 123')
+        proc._child_ctor = _ctor
+        proc.run(self.q)
+        assert self.q.got_message(b"hello\nworld\n")
 
     def test_output_receives_lines_invalid_utf8(self):
         def _ctor(*args, **kwargs):
@@ -164,8 +182,21 @@ class TestProcess(object):
         proc = Process('echo 123', quiet=True)
         proc._child_ctor = _ctor
         proc.run(self.q)
-        assert not self.q.got_message(b"hello\n")
-        assert not self.q.got_message(b"world\n")
+        assert self.q.output() == b""
+
+    def test_quiet_output_not_piped(self):
+        proc = Process('echo 123', quiet=True)
+        proc._child_ctor = FakePopen
+        proc.spawn(self.q)
+        assert proc._child.kwargs['stdout'] == subprocess.DEVNULL
+
+    @pytest.mark.skipif(sys.platform == 'win32', reason="uses a POSIX shell command")
+    def test_quiet_output_written_to_log(self, tmp_path):
+        log = tmp_path / 'foo.log'
+        proc = Process('echo hello', quiet=True, quiet_log=str(log))
+        proc.run(self.q)
+        assert log.read_bytes() == b'hello\n'
+        assert [msg.type for msg in self.q.messages] == ['start', 'stop']
 
     def test_output_receives_stop(self):
         proc = Process('echo 123')
@@ -191,3 +222,157 @@ class TestProcess(object):
         proc._child_ctor = FakePopen
         proc.run(self.q)
         assert proc._child.kwargs['cwd'] == 'fake-dir'
+
+    def test_env_defaults_to_os_environ(self, monkeypatch):
+        monkeypatch.setenv('ANIMAL', 'giraffe')
+        proc = Process('echo 123')
+        proc.env['PLANT'] = 'fern'
+        assert 'PLANT' not in os.environ
+        proc._child_ctor = FakePopen
+        proc.run(self.q)
+        env = proc._child.kwargs['env']
+        assert type(env) is dict
+        assert env['ANIMAL'] == 'giraffe'
+        assert env['PLANT'] == 'fern'
+
+    def test_spawn_sends_start(self):
+        proc = Process('echo 123')
+        proc._child_ctor = FakePopen
+        proc.spawn(self.q)
+        assert len(self.q.messages) == 1
+        assert self.q.messages[0].type == 'start'
+
+    def test_read_sends_lines(self):
+        def _ctor(*args, **kwargs):
+            popen = FakePopen(*args, **kwargs)
+            popen.stdout = FakeOutput([b"hello\nwor", b"ld\n"])
+            return popen
+
+        proc = Process('echo 123')
+        proc._child_ctor = _ctor
+        proc.spawn(self.q)
+        while proc.read():
+            pass
+        proc.finish()
+        assert self.q.output() == b"hello\nworld\n"
+        assert self.q.messages[-1].type == 'stop'
+
+    def test_read_sends_partial_line_at_eof(self):
+        def _ctor(*args, **kwargs):
+            popen = FakePopen(*args, **kwargs)
+            popen.stdout = FakeOutput([b"no newline"])
+            return popen
+
+        proc = Process('echo 123')
+        proc._child_ctor = _ctor
+        proc.spawn(self.q)
+        while proc.read():
+            pass
+        proc.finish()
+        assert self.q.got_message(b"no newline")
+
+    @pytest.mark.skipif(not hasattr(os, 'pidfd_open'), reason="requires pidfd")
+    def test_stop_not_delayed_by_inherited_output(self):
+        # The backgrounded sleep inherits the shell's stdout, so EOF won't
+        # arrive until it exits.
+        proc = Process('sleep 10 & echo hello')
+        start = time.monotonic()
+        proc.run(self.q)
+        assert time.monotonic() - start < 5
+        assert self.q.got_message(b"hello\n")
+        assert self.q.messages[-1].type == 'stop'
+
+
+class TestLineBuffer(object):
+
+    def test_invalid_max_length(self):
+        with pytest.raises(ValueError):
+            LineBuffer(max_length=0)
+        with pytest.raises(ValueError):
+            Process('echo 123', max_line_length=0)
+
+    def test_feed_complete_lines(self):
+        buf = LineBuffer()
+        assert buf.feed(b"one\ntwo\n") == b"one\ntwo\n"
+        assert buf.flush() == b""
+
+    def test_feed_holds_partial_line(self):
+        buf = LineBuffer()
+        assert buf.feed(b"one\ntw") == b"one\n"
+        assert buf.feed(b"o\nthree") == b"two\n"
+        assert buf.flush() == b"three"
+
+    def test_feed_partial_line_across_many_chunks(self):
+        buf = LineBuffer()
+        assert buf.feed(b"a") == b""
+        assert buf.feed(b"b") == b""
+        assert buf.feed(b"c\n") == b"abc\n"
+
+    def test_feed_splits_long_lines(self):
+        buf = LineBuffer(max_length=4)
+        assert buf.feed(b"abcdefghij\nkl\n") == b"abcd\nefgh\nij\nkl\n"
+
+    def test_feed_splits_long_partial_line(self):
+        buf = LineBuffer(max_length=4)
+        assert buf.feed(b"abcdef") == b"abcd\n"
+        assert buf.feed(b"ghijkl") == b"efgh\n"
+        assert buf.feed(b"\n") == b"ijkl\n"
+
+    def test_feed_truncates_long_lines(self):
+        buf = LineBuffer(max_length=4, truncate=True)
+        assert buf.feed(b"abcdefghij\nkl\n") == b"abcd [truncated]\nkl\n"
+
+    def test_feed_truncates_long_partial_line(self):
+        buf = LineBuffer(max_length=4, truncate=True)
+        assert buf.feed(b"abcdef") == b"abcd [truncated]\n"
+        assert buf.feed(b"ghijkl") == b""
+        assert buf.feed(b"mn\nop\nq") == b"op\n"
+        assert buf.flush() == b"q"
+
+    def test_feed_bounds_partial_line(self):
+        buf = LineBuffer(max_length=10)
+        for _ in range(1000):
+            buf.feed(b"x" * 7)
+            assert sum(map(len, buf._partial)) <= 10
+
+
+@pytest.mark.parametrize('cmd,argv', [
+    ('sleep 10', ['sleep', '10']),
+    ("python -c 'print(1)'", ['python', '-c', 'print(1)']),
+    ('echo "a b"', ['echo', 'a b']),
+    ('FOO=1 python app.py', None),
+    ('cd /tmp', None),
+    ('echo $HOME', None),
+    ('echo "$HOME"', None),
+    ('ls *.py', None),
+    ('yes | head', None),
+    ('~/bin/server', None),
+    ('echo a\\ b', None),
+    ('echo "unbalanced', None),
+    ('', None),
+])
+def test_split_command(cmd, argv):
+    assert split_command(cmd) == argv
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="uses POSIX commands")
+class TestPopen(object):
+
+    def test_direct_exec(self):
+        child = Popen('echo hello', direct_exec=True)
+        out, _ = child.communicate()
+        assert child.args == ['echo', 'hello']
+        assert out == b'hello\n'
+
+    def test_direct_exec_missing_command(self):
+        child = Popen('honcho-no-such-command --flag', direct_exec=True)
+        out, _ = child.communicate()
+        assert child.args == 'honcho-no-such-command --flag'
+        assert child.returncode == 127
+        assert b'honcho-no-such-command' in out
+
+    def test_direct_exec_falls_back_to_shell(self):
+        child = Popen('echo $0', direct_exec=True)
+        out, _ = child.communicate()
+        assert child.args == 'echo $0'
+        assert out.strip() != b'echo'